@@ -0,0 +1,193 @@
+# aggregation.py
+# موتور پاسخ به سؤال‌های تجمیعی: شمارش، گروه‌بندی و فهرست تیترها به صورت محلی از داده‌های ساختاریافته محاسبه می‌شود.
+# برای خلاصه‌سازی متنی، داده‌ها در بخش‌هایی با بودجه توکن مشخص، به صورت موازی خلاصه و سپس ادغام می‌شوند (map-reduce).
+# خلاصه هر بخش بر اساس محتوای آن کش می‌شود تا سؤال‌های تجمیعی بعدی از آن استفاده کنند.
+
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import telemetry
+from text_normalize import normalize_text, phrase_hits, remove_phrases
+
+COUNT, GROUP, LIST, SUMMARY = 'count', 'group', 'list', 'summary'
+CHARS_PER_TOKEN = 3  # تخمین محافظه‌کارانه برای متن فارسی
+SINGLE_PASS_TOKEN_BUDGET = 30_000
+CHUNK_TOKEN_BUDGET = 6_000
+MAP_CONCURRENCY = 4
+MAX_LISTED_ITEMS = 300
+
+_KIND_CUES = (
+    (COUNT, ('چند', 'چندتا', 'تعداد', 'چه تعداد', 'how many', 'count', 'number of')),
+    (GROUP, ('دسته بندی', 'دستهبندی', 'دسته', 'گروه بندی', 'گروه', 'بر اساس', 'به تفکیک', 'هر منبع', 'هر سایت', 'per source', 'by source', 'by category',
+             'category', 'categories', 'categorize', 'categorise', 'group', 'grouped')),
+    (LIST, ('لیست', 'فهرست', 'تیتر', 'تیترها', 'عناوین', 'عنوانها', 'list', 'headlines', 'titles')),
+)
+# کلماتی که معنای سؤال را به یک زیرمجموعه از خبرها محدود نمی‌کنند
+_GENERIC_WORDS = set("""
+خبر خبرها اخبار همه تمام تمامی کل را رو به از در و با بده بدهید کن کنید هست هستند است وجود دارد دارند چه چی
+هر داریم دارم داره هستش موجوده بندی کن لطفا لطفاً بگو بگید نشان بنویس شده استخراج موجود سایت سایتها منبع منابع ها های این آن امروز ی یک
+news items item articles article all the a an of in on me give show please list are there is what tell
+""".split())
+
+
+@dataclass
+class AggregationPlan:
+    kind: str
+    answer: str | None = None   # پاسخ محلی کامل (بدون نیاز به مدل)
+    prompt: str | None = None   # پرامپت نهایی (مرحله reduce) برای تولید جریانی پاسخ
+    chunks: int = 0
+    cached_chunks: int = 0
+
+
+def detect_kind(query: str) -> str:
+    text = normalize_text(query)
+    for kind, cues in _KIND_CUES:
+        if phrase_hits(text, cues): return kind
+    return SUMMARY
+
+
+def _is_unfiltered(query: str, kind: str) -> bool:
+    """آیا سؤال فقط شمارش/فهرست کلی می‌خواهد؟ اگر کلمه محتوایی (مثل «فوتبال») داشته باشد، به مدل سپرده می‌شود."""
+    cues = dict(_KIND_CUES)[kind]
+    text = remove_phrases(normalize_text(query), cues)
+    return not [word for word in text.split() if word not in _GENERIC_WORDS]
+
+
+def source_of(item: dict) -> str:
+    return item.get('source') or urlsplit(item.get('link') or '').netloc or 'نامشخص'
+
+
+def category_of(item: dict) -> str:
+    """دسته خبر: فیلد category در صورت وجود و در غیر این صورت اولین بخش معنادار مسیر لینک."""
+    if item.get('category'): return str(item['category'])
+    segments = [s for s in urlsplit(item.get('link') or '').path.split('/') if s and not s.isdigit() and len(s) > 2]
+    return segments[0] if len(segments) > 1 else 'عمومی'
+
+
+def _local_answer(kind: str, items: list) -> str:
+    by_source = Counter(source_of(item) for item in items)
+    if kind == COUNT:
+        lines = [f"تعداد کل اخبار استخراج شده: **{len(items)}**"]
+        if len(by_source) > 1:
+            lines += ["", "به تفکیک منبع:"] + [f"- `{source}`: {count}" for source, count in by_source.most_common()]
+        return "\n".join(lines)
+    if kind == GROUP:
+        key = source_of if len(by_source) > 1 else category_of
+        groups = OrderedDict()
+        for item in items: groups.setdefault(key(item), []).append(item)
+        lines = [f"**{len(items)}** خبر در **{len(groups)}** گروه:"]
+        for name, members in sorted(groups.items(), key=lambda pair: -len(pair[1])):
+            lines += ["", f"#### {name} ({len(members)})"] + [_headline(item) for item in members[:MAX_LISTED_ITEMS]]
+        return "\n".join(lines)
+    lines = [f"فهرست تیترها (**{len(items)}** خبر):", ""] + [_headline(item) for item in items[:MAX_LISTED_ITEMS]]
+    if len(items) > MAX_LISTED_ITEMS: lines.append(f"\n… و {len(items) - MAX_LISTED_ITEMS} خبر دیگر.")
+    return "\n".join(lines)
+
+
+def _headline(item: dict) -> str:
+    title = (item.get('title') or 'بدون عنوان').replace('[', '(').replace(']', ')')
+    return f"- [{title}]({item['link']})" if item.get('link') else f"- {title}"
+
+
+def _item_text(item: dict) -> str:
+    text = f"عنوان: {item.get('title', 'بدون عنوان')}\nلینک: {item.get('link', 'بدون لینک')}"
+    if item.get('description'): text += f"\nتوضیحات: {item['description']}"
+    return text
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_items(texts: list, token_budget: int = CHUNK_TOKEN_BUDGET) -> list:
+    chunks, current, used = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and used + tokens > token_budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current: chunks.append(current)
+    return chunks
+
+
+class ChunkSummaryCache:
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            return None
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            self._entries[key] = summary
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+
+chunk_summaries = ChunkSummaryCache()
+
+
+def _map_prompt(chunk_text: str) -> str:
+    return f"""Summarize the following news items in Persian. Group related items by topic, keep it concise, and keep each item's source link as a Markdown link [title](URL). Do not invent information.
+News items:
+{chunk_text}"""
+
+
+def _summarize_chunk(generation_model, chunk: list) -> tuple[str, bool]:
+    chunk_text = "\n\n".join(chunk)
+    key = hashlib.sha256(chunk_text.encode('utf-8')).hexdigest()
+    cached = chunk_summaries.get(key)
+    if cached is not None: return cached, True
+    with telemetry.span('chat.map', chunk_items=len(chunk)) as span:
+        response = generation_model.generate_content(_map_prompt(chunk_text))
+        telemetry.record_usage(span, response)
+    summary = response.text
+    chunk_summaries.put(key, summary)
+    return summary, False
+
+
+def _stats_text(items: list) -> str:
+    by_source = Counter(source_of(item) for item in items)
+    return f"Total articles: {len(items)}\nArticles per source: " + ", ".join(f"{s}: {c}" for s, c in by_source.most_common())
+
+
+def plan_aggregation(query: str, items: list, generation_model) -> AggregationPlan:
+    """پاسخ محلی در صورت امکان؛ در غیر این صورت پرامپت نهایی (پس از خلاصه‌سازی موازی بخش‌ها در صورت نیاز)."""
+    items = [item for item in items or [] if isinstance(item, dict)]
+    kind = detect_kind(query)
+    if kind != SUMMARY and _is_unfiltered(query, kind):
+        return AggregationPlan(kind=kind, answer=_local_answer(kind, items))
+
+    texts = [_item_text(item) for item in items]
+    instructions = "You are an assistant. Answer the user's question in Persian based ONLY on the provided data. Create a clear, structured, and categorized answer and keep source links as Markdown links [title](URL)."
+    if sum(estimate_tokens(text) for text in texts) <= SINGLE_PASS_TOKEN_BUDGET:
+        return AggregationPlan(kind=kind, prompt=f"""{instructions}
+Data statistics (computed exactly):
+{_stats_text(items)}
+Data:
+{chr(10).join(texts)}
+User's Question: {query}""")
+
+    chunks = chunk_items(texts)
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+        futures = [telemetry.submit(executor, _summarize_chunk, generation_model, chunk) for chunk in chunks]
+        results = [future.result() for future in futures]
+    partials = "\n\n".join(f"### Part {i}\n{summary}" for i, (summary, _) in enumerate(results, start=1))
+    return AggregationPlan(kind=kind, chunks=len(chunks), cached_chunks=sum(1 for _, hit in results if hit), prompt=f"""{instructions}
+The data was too large for a single request, so it was summarized in parts. Merge the partial summaries below into one answer, removing duplicates.
+Data statistics (computed exactly over all articles):
+{_stats_text(items)}
+Partial summaries:
+{partials}
+User's Question: {query}""")
@@ -0,0 +1,536 @@
+# benchmark.py
+# بنچمارک آفلاین مسیر پردازش: دریافت، پارس، خلاصه‌سازی HTML، اجرای اسکرپر، ساخت شاخص برداری، جستجو و چت.
+# صفحات از فایل‌های ضبط شده (benchmarks/fixtures) یا در نبود آن‌ها از صفحات مصنوعی منطبق با اسکرپرهای ذخیره شده
+# خوانده می‌شوند و از یک سرور HTTP محلی سرو می‌شوند. به جای Gemini یک نسخه محلی و قطعی
+# (generate_content و embed_content) استفاده می‌شود؛ بنابراین نتایج فقط هزینه کد خود برنامه را نشان می‌دهند.
+#
+#   python benchmark.py record                       # ضبط صفحه اصلی دامنه‌های اسکرپرهای ذخیره شده
+#   python benchmark.py run --sizes 1 8 32 -o bench.json
+#   python benchmark.py run --compare bench.json     # در صورت کندتر شدن بیش از حد مجاز، کد خروج 1
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import google.generativeai as genai
+import numpy as np
+
+import telemetry
+from aggregation import plan_aggregation
+from chat_engine import AGGREGATION, classify_intent, format_context, retrieval_prompt, stream_text
+from crawler import DEFAULT_WORKERS, create_session, fetch_url
+from embeddings import EmbeddingCache, RateLimiter, embed_texts
+from html_distill import distill_element, parse_html, select_samples
+from scraper_runtime import run_many, shutdown as shutdown_runtime
+from scraper_store import article_selector_for, load_scrapers
+from selector_engine import extract_with_spec, is_spec, make_spec
+from text_normalize import normalize_text
+from vector_index import VectorIndex, document_text
+
+FIXTURE_DIR = os.path.join('benchmarks', 'fixtures')
+DEFAULT_SIZES = (1, 8, 32)
+DEFAULT_ARTICLES_PER_PAGE = 40
+DEFAULT_REPEATS = 3
+DEFAULT_TOLERANCE = 0.25
+EMBEDDING_DIM = 768
+SEARCH_QUERIES = ('آخرین خبرهای اقتصاد', 'elecciones presidenciales', 'mercado y economía regional',
+                  'crisis climática en la región', 'acuerdo de paz', 'resultados del fútbol')
+CHAT_QUESTIONS = ('لیست همه تیترها', 'چند خبر داریم؟', 'درباره انتخابات چه گفته شده؟', 'خلاصه اخبار اقتصادی')
+
+
+# --- نسخه محلی Gemini ---
+@lru_cache(maxsize=65_536)
+def _word_vector(word: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+
+
+def mock_embedding(text: str) -> list:
+    """بردار قطعی: مجموع بردارهای تصادفی کلمات؛ متن‌های با کلمات مشترک بردارهای نزدیک‌تری دارند."""
+    words = normalize_text(text).split() or ['']
+    vector = np.sum([_word_vector(word) for word in words], axis=0)
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+class MockBackend:
+    """جایگزین قطعی `genai.embed_content` و `GenerativeModel.generate_content` با تأخیر اختیاری هر فراخوانی."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {'generate': 0, 'embed': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind: str):
+        with self._lock: self.calls[kind] += 1
+        if self.latency: time.sleep(self.latency)
+
+    def embed_content(self, model: str, content, task_type: str | None = None, **kwargs) -> dict:
+        self._count('embed')
+        if isinstance(content, str): return {'embedding': mock_embedding(content)}
+        return {'embedding': [mock_embedding(text) for text in content]}
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        self._count('generate')
+        text = self._respond(prompt)
+        if not stream: return _MockResponse(text)
+        words = text.split(' ')
+        return iter(_MockResponse(" ".join(words[i:i + 4]) + " ") for i in range(0, len(words), 4))
+
+    def _respond(self, prompt: str) -> str:
+        if prompt.startswith("Classify the user's query"):
+            query = re.search(r'Query: "(.*)"', prompt, re.S)
+            cues = ('لیست', 'فهرست', 'چند', 'خلاصه', 'list', 'how many', 'summar')
+            return 'aggregation' if query and any(cue in query.group(1).lower() for cue in cues) else 'retrieval'
+        titles = re.findall(r'عنوان: (.*)', prompt)
+        if prompt.startswith("Summarize the following news items"):
+            return "خلاصه این بخش: " + "؛ ".join(titles[:5])
+        lines = [f"- {title}" for title in titles[:10]] or ["- اطلاعاتی در داده‌ها یافت نشد."]
+        return "بر اساس اخبار استخراج شده:\n" + "\n".join(lines)
+
+
+@dataclass
+class _MockResponse:
+    text: str
+
+
+@contextlib.contextmanager
+def mock_backend(backend: MockBackend):
+    """نصب موقت نسخه محلی روی ماژول genai (همان مسیری که embeddings.py صدا می‌زند)."""
+    original = genai.embed_content
+    genai.embed_content = backend.embed_content
+    try:
+        yield backend
+    finally:
+        genai.embed_content = original
+
+
+# --- صفحات مصنوعی منطبق با اسکرپرهای scrapers.json ---
+_TEMPLATES = {
+    'www.infobae.com': {
+        'base_url': 'https://www.infobae.com/america/',
+        'article': '<a class="story-card-ctn" href="/america/mundo/2026/{page}/{slug}/"><h2 class="story-card-hl">{title}</h2>'
+                   '<h3 class="story-card-deck">{description}</h3></a>',
+        'analysis': {'best_article_selector': 'a.story-card-ctn', 'title_selector': 'h2.story-card-hl',
+                     'link_selector': 'self', 'description_selector': 'h3.story-card-deck'},
+    },
+    'www.dw.com': {
+        'base_url': 'https://www.dw.com/es/actualidad/s-30684',
+        'article': '<div class="teaser-wrap"><div class="title"><a href="/es/{slug}/a-{page}{index}">{title}</a></div>'
+                   '<div class="teaser-description"><a href="/es/{slug}/a-{page}{index}">{description}</a></div></div>',
+        'analysis': {'best_article_selector': '.teaser-wrap, .news-item', 'title_selector': '.title a, .news-title a',
+                     'link_selector': '.title a, .news-title a', 'description_selector': '.teaser-description a'},
+    },
+    'www.youtube.com': {
+        'base_url': 'https://www.youtube.com/results?search_query=Am%C3%A9rica+Latina',
+        'article': '<ytd-video-renderer class="style-scope"><div id="meta"><a id="video-title" href="/watch?v={slug}">{title}</a>'
+                   '<yt-formatted-string class="metadata-snippet-text">{description}</yt-formatted-string></div></ytd-video-renderer>',
+        'analysis': {'best_article_selector': 'ytd-video-renderer', 'title_selector': 'a#video-title',
+                     'link_selector': 'a#video-title',
+                     'description_selector': 'yt-formatted-string.metadata-snippet-text, yt-formatted-string#description-text'},
+    },
+    'www.france24.com': {
+        'base_url': 'https://www.france24.com/es/',
+        'article': '<div class="m-item-list-article"><div class="article__title"><a href="/es/{slug}"><h2>{title}</h2></a></div>'
+                   '<p class="article__chapo">{description}</p></div>',
+        'analysis': {'best_article_selector': '.m-item-list-article', 'title_selector': '.article__title h2',
+                     'link_selector': '.article__title a', 'description_selector': '.article__chapo'},
+    },
+}
+_WORDS = ("gobierno elecciones economía mercado inflación acuerdo paz crisis climática región presidente ministro "
+          "fútbol resultados salud educación tecnología empresas exportaciones energía petróleo frontera migración "
+          "tribunal congreso reforma protesta seguridad ciudad lluvia sequía cosecha turismo bolsa dólar").split()
+_NOISE_SCRIPT = "<script>window.__STATE__ = " + json.dumps({"k%d" % i: "x" * 64 for i in range(400)}) + ";</script>"
+_NOISE_STYLE = "<style>" + "".join(f".c{i}{{margin:{i}px;padding:0 {i}px;color:#{i:06x}}}" for i in range(300)) + "</style>"
+
+
+def synthesize_page(domain: str, page: int, articles: int = DEFAULT_ARTICLES_PER_PAGE) -> str:
+    """صفحه‌ای با اسکلت شبیه سایت واقعی (اسکریپت، استایل، منو، فوتر) و خبرهایی در قالب سلکتورهای اسکرپر دامنه."""
+    template = _TEMPLATES[domain]
+    rng = random.Random(f"{domain}:{page}")
+    items = []
+    for index in range(articles):
+        title = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 12))).capitalize() + f" {page}-{index}"
+        description = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(15, 35))).capitalize() + "."
+        slug = "-".join(title.lower().split()[:6]) + f"-{page}-{index}"
+        items.append(template['article'].format(page=page, index=index, slug=slug, title=title, description=description))
+    nav = "".join(f'<li class="nav-item c{i}"><a href="/es/seccion-{i}" data-track="nav-{i}">Sección {i}</a></li>' for i in range(60))
+    return (f"<!DOCTYPE html><html lang=\"es\"><head><meta charset=\"utf-8\"><title>{domain}</title>{_NOISE_STYLE}"
+            f"{_NOISE_SCRIPT}</head><body><header><nav><ul>{nav}</ul></nav></header><main>"
+            + "".join(f'<section class="block c{i % 7}"><div class="grid">{item}</div></section>' for i, item in enumerate(items))
+            + f"</main><footer>{nav}<svg><path d=\"M0 0L10 10\"/></svg></footer>{_NOISE_SCRIPT}</body></html>")
+
+
+def _fixture_path(fixture_dir: str, domain: str) -> str:
+    return os.path.join(fixture_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', domain) + '.html')
+
+
+def load_corpus(size: int, scrapers: dict, fixture_dir: str = FIXTURE_DIR, synthetic: bool = False,
+                articles: int = DEFAULT_ARTICLES_PER_PAGE) -> list:
+    """فهرست (دامنه، html) به طول size؛ صفحات ضبط شده در اولویت‌اند و به صورت چرخشی تکرار می‌شوند."""
+    recorded = {}
+    if not synthetic:
+        for domain in scrapers:
+            path = _fixture_path(fixture_dir, domain)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f: recorded[domain] = f.read()
+    domains = [domain for domain in scrapers if domain in recorded or domain in _TEMPLATES]
+    if not domains: raise SystemExit("هیچ صفحه ضبط شده یا قالب مصنوعی برای اسکرپرهای ذخیره شده وجود ندارد.")
+    corpus = []
+    for page in range(size):
+        domain = domains[page % len(domains)]
+        corpus.append((domain, recorded.get(domain) or synthesize_page(domain, page, articles)))
+    return corpus
+
+
+# --- سرور محلی برای مرحله دریافت ---
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive، مانند سایت‌های واقعی
+    disable_nagle_algorithm = True
+    pages: list = []
+
+    def do_GET(self):
+        try:
+            body = self.pages[int(self.path.strip('/').split('/')[-1])]
+        except (ValueError, IndexError):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_corpus(corpus: list):
+    handler = type('Handler', (_FixtureHandler,), {'pages': [gzip.compress(html.encode('utf-8'), 6) for _, html in corpus]})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield [f"http://127.0.0.1:{server.server_port}/{domain}/{i}" for i, (domain, _) in enumerate(corpus)]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# --- اندازه‌گیری ---
+@dataclass
+class StageResult:
+    stage: str
+    size: int
+    units: int
+    unit: str
+    seconds: float
+    throughput: float
+    p50_ms: float | None = None
+    p95_ms: float | None = None
+    peak_mb: float | None = None
+    extra: dict = field(default_factory=dict)
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(stage: str, size: int, unit: str, func, repeats: int = DEFAULT_REPEATS, trace_memory: bool = True,
+            setup=None) -> StageResult:
+    """func باید (تعداد واحدها، زمان هر عملیات بر حسب ثانیه یا None، اطلاعات اضافه) برگرداند.
+    زمان میانه چند تکرار گزارش می‌شود؛ حافظه در یک اجرای جداگانه با tracemalloc اندازه‌گیری می‌شود تا زمان‌ها مخدوش نشوند."""
+    timings, per_op, units, extra = [], [], 0, {}
+    for _ in range(repeats):
+        if setup: setup()
+        started = time.perf_counter()
+        units, op_seconds, extra = func()
+        timings.append(time.perf_counter() - started)
+        per_op.extend(op_seconds or [])
+    seconds = statistics.median(timings)
+    result = StageResult(stage=stage, size=size, units=units, unit=unit, seconds=seconds,
+                         throughput=units / seconds if seconds else 0.0, extra=extra)
+    if per_op:
+        result.p50_ms, result.p95_ms = _percentile(per_op, 0.5) * 1000, _percentile(per_op, 0.95) * 1000
+    if trace_memory:
+        if setup: setup()
+        tracemalloc.start()
+        try:
+            func()
+            result.peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_size(size: int, corpus: list, scrapers: dict, backend: MockBackend, work_dir: str, repeats: int,
+             workers: int, trace_memory: bool) -> list:
+    results = []
+
+    def record(result: StageResult):
+        results.append(result)
+        print(_format_row(result), file=sys.stderr)
+
+    # ۱. دریافت از سرور محلی (Session مشترک، gzip، کارگرهای هم‌زمان)
+    with serve_corpus(corpus) as urls:
+        session = create_session(workers)
+
+        def fetch_all():
+            def timed(url):
+                started = time.perf_counter()
+                fetch_url(url, session=session)
+                return time.perf_counter() - started
+            with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+                return len(urls), list(executor.map(timed, urls)), {}
+        record(measure('fetch', size, 'pages', fetch_all, repeats, trace_memory))
+        session.close()
+
+    pages = [html for _, html in corpus]
+    page_bytes = sum(len(html.encode('utf-8')) for html in pages)
+
+    # ۲. پارس با lxml
+    def parse_all():
+        op = []
+        for html in pages:
+            started = time.perf_counter()
+            parse_html(html)
+            op.append(time.perf_counter() - started)
+        return len(pages), op, {'mb': round(page_bytes / 2 ** 20, 2)}
+    record(measure('parse', size, 'pages', parse_all, repeats, trace_memory))
+
+    # ۳. آماده‌سازی پرامپت‌های ساخت اسکرپر (خلاصه‌سازی بدنه و نمونه‌ها، مانند generate_scraper_with_gemini)
+    def distill_all():
+        op, before, after = [], 0, 0
+        for domain, html in corpus:
+            started = time.perf_counter()
+            root = parse_html(html)
+            body = root.find('body')
+            sample = distill_element(body) if body is not None else ""
+            selector = article_selector_for(scrapers[domain])
+            samples = select_samples(root, [selector] if selector else [], limit=5)
+            sample += "".join(distill_element(article, max_chars=8000) for article in samples)
+            op.append(time.perf_counter() - started)
+            before, after = before + len(html), after + len(sample)
+        return len(corpus), op, {'reduction': round(before / max(after, 1), 1)}
+    record(measure('distill', size, 'pages', distill_all, repeats, trace_memory))
+
+    # ۴. اجرای اسکرپرهای ذخیره شده: کد پایتون در استخر ایزوله و مشخصات سلکتور با موتور lxml
+    code_jobs = [(html, scrapers[domain]) for domain, html in corpus if not is_spec(scrapers[domain])]
+    if code_jobs:
+        run_many(code_jobs[:1])  # راه‌اندازی استخر پردازه‌ها خارج از زمان‌سنجی
+
+        def scrape_code():
+            outputs = run_many(code_jobs)
+            failures = [o for o in outputs if isinstance(o, Exception)]
+            return sum(len(o) for o in outputs if not isinstance(o, Exception)), None, {'pages': len(code_jobs), 'failures': len(failures)}
+        record(measure('scrape_code', size, 'items', scrape_code, repeats, trace_memory))
+
+    specs = {domain: scrapers[domain] if is_spec(scrapers[domain]) else make_spec(_TEMPLATES[domain]['analysis'], _TEMPLATES[domain]['base_url'])
+             for domain, _ in corpus if is_spec(scrapers[domain]) or domain in _TEMPLATES}
+    items = []
+
+    def scrape_spec():
+        op, extracted = [], []
+        for domain, html in corpus:
+            if domain not in specs: continue
+            started = time.perf_counter()
+            found = extract_with_spec(html, specs[domain])
+            op.append(time.perf_counter() - started)
+            for item in found: item['source'] = domain
+            extracted.extend(found)
+        items[:] = extracted
+        return len(extracted), op, {'pages': len(op)}
+    record(measure('scrape_spec', size, 'items', scrape_spec, repeats, trace_memory))
+
+    # ۵. ساخت شاخص برداری: embedding سرد (کش خالی) و گرم (همه از کش)
+    contents = [document_text(item) for item in items]
+    limiter = RateLimiter(requests_per_minute=10 ** 9, burst=10 ** 6)
+    holder = {'runs': 0}
+
+    def reset_cache():
+        holder['runs'] += 1
+        holder['cache'] = EmbeddingCache(os.path.join(work_dir, f"embeddings-{size}-{holder['runs']}.sqlite3"))
+
+    def build_index():
+        vectors, stats = embed_texts(contents, cache=holder['cache'], limiter=limiter)
+        index = VectorIndex()
+        index.add(np.vstack(vectors), contents, [{'link': item.get('link'), 'source': item.get('source')} for item in items])
+        holder['index'] = index
+        return len(contents), None, stats
+    if contents:
+        record(measure('embed_cold', size, 'docs', build_index, repeats, trace_memory, setup=reset_cache))
+        record(measure('embed_warm', size, 'docs', build_index, repeats, trace_memory))
+
+        # ۶. جستجو مانند مسیر چت: تطابق واژگانی قوی فقط BM25، در غیر این صورت embedding سؤال (از کش پس از
+        # اولین تکرار) + ترکیب جستجوی برداری و BM25
+        def search_all():
+            op, lexical_only = [], 0
+            index = holder['index']
+            for query in SEARCH_QUERIES:
+                started = time.perf_counter()
+                if index.lexical.is_strong_match(query):
+                    lexical_only += 1
+                    index.hybrid_search(query, top_k=7)
+                else:
+                    vectors, _ = embed_texts([query], task_type="RETRIEVAL_QUERY", cache=holder['cache'], limiter=limiter)
+                    index.hybrid_search(query, vectors[0], top_k=7)
+                op.append(time.perf_counter() - started)
+            return len(SEARCH_QUERIES), op, {'lexical_only': lexical_only}
+        record(measure('search', size, 'queries', search_all, max(repeats, 5), trace_memory))
+
+    # ۷. مسیر چت مانند gemini_scraper_app.py: تشخیص نوع سؤال و سپس برنامه تجمیع یا جستجوی ترکیبی، و دریافت جریانی پاسخ
+    def answer_prompt(question: str, intent: str) -> str | None:
+        if intent == AGGREGATION:
+            plan = plan_aggregation(question, items, backend)
+            return plan.prompt  # پاسخ‌های محلی (plan.answer) به مدل ارسال نمی‌شوند
+        index = holder.get('index')
+        if index is None: return None
+        if index.lexical.is_strong_match(question):
+            results = index.hybrid_search(question, top_k=7)
+        else:
+            vectors, _ = embed_texts([question], task_type="RETRIEVAL_QUERY", cache=holder['cache'], limiter=limiter)
+            results = index.hybrid_search(question, vectors[0], top_k=7)
+        context = format_context([index.contents[doc_id] for doc_id, _score in results])
+        return retrieval_prompt(question, context) if context else None
+
+    def chat_all():
+        op, first_token, intents = [], [], Counter()
+        for question in CHAT_QUESTIONS:
+            started = time.perf_counter()
+            intent, _ = classify_intent(question, backend)
+            intents[intent] += 1
+            prompt = answer_prompt(question, intent)
+            for i, _chunk in enumerate(stream_text(backend, prompt) if prompt else ()):
+                if i == 0: first_token.append(time.perf_counter() - started)
+            op.append(time.perf_counter() - started)
+        return len(CHAT_QUESTIONS), op, {'ttft_ms': round(statistics.median(first_token) * 1000, 2) if first_token else None,
+                                         **intents}
+    record(measure('chat', size, 'questions', chat_all, repeats, trace_memory))
+    return results
+
+
+def _format_row(result: StageResult) -> str:
+    latency = f"p50 {result.p50_ms:8.2f}ms p95 {result.p95_ms:8.2f}ms" if result.p50_ms is not None else " " * 30
+    memory = f"{result.peak_mb:8.1f}MB" if result.peak_mb is not None else " " * 10
+    return (f"[size {result.size:>4}] {result.stage:<12} {result.seconds * 1000:10.1f}ms "
+            f"{result.throughput:10.1f} {result.unit}/s  {latency}  {memory}  {json.dumps(result.extra, ensure_ascii=False)}")
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """مراحلی که زمانشان نسبت به خط مبنا بیش از tolerance (نسبی) افزایش یافته است."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(row['stage'], row['size']): row for row in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get((result.stage, result.size))
+        if old and old['seconds'] > 0 and result.seconds > old['seconds'] * (1 + tolerance):
+            regressions.append(f"{result.stage} (size {result.size}): {old['seconds'] * 1000:.1f}ms -> {result.seconds * 1000:.1f}ms")
+    return regressions
+
+
+def run(args) -> int:
+    scrapers = {domain: scraper for domain, scraper in load_scrapers().items() if scraper}
+    backend = MockBackend(latency=args.api_latency)
+    work_dir = tempfile.mkdtemp(prefix='scraper-bench-')
+    telemetry.exporter.path = None  # spanهای بنچمارک در فایل telemetry برنامه نوشته نمی‌شوند
+    results = []
+    try:
+        with mock_backend(backend):
+            for size in args.sizes:
+                corpus = load_corpus(size, scrapers, args.fixtures, args.synthetic, args.articles)
+                results += run_size(size, corpus, scrapers, backend, work_dir, args.repeats, args.workers, not args.no_memory)
+    finally:
+        shutdown_runtime()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'api_latency': args.api_latency,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'mock_calls': backend.calls,
+        'results': [asdict(result) for result in results],
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"max RSS: {report['max_rss_mb']:.1f}MB, mock API calls: {backend.calls}", file=sys.stderr)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions: print(f"[REGRESSION] {line}", file=sys.stderr)
+        if regressions: return 1
+    return 0
+
+
+def _base_url(scraper) -> str | None:
+    if isinstance(scraper, dict): return scraper.get('base_url')
+    match = re.search(r"""(?i)base_url\s*=\s*['"](https?://[^'"]+)['"]""", scraper)
+    return match.group(1) if match else None
+
+
+def record(args) -> int:
+    """ضبط صفحات واقعی در پوشه fixtures برای اجراهای بعدی بنچمارک (تنها مرحله‌ای که به شبکه نیاز دارد)."""
+    os.makedirs(args.fixtures, exist_ok=True)
+    urls = list(args.urls) or [_base_url(scraper) or f"https://{domain}/" for domain, scraper in load_scrapers().items()]
+    failures = 0
+    for url in urls:
+        try:
+            html = fetch_url(url)
+        except Exception as e:
+            failures += 1
+            print(f"[FAIL] {url}: {e}", file=sys.stderr)
+            continue
+        path = _fixture_path(args.fixtures, urlsplit(url).netloc)
+        with open(path, 'w', encoding='utf-8') as f: f.write(html)
+        print(f"[OK] {url} -> {path} ({len(html):,} chars)", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="بنچمارک آفلاین مسیر استخراج و چت با صفحات ضبط شده و Gemini محلی.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="ضبط صفحات اصلی دامنه‌ها در پوشه fixtures")
+    record_parser.add_argument("urls", nargs="*", help="آدرس‌ها (پیش‌فرض: آدرس پایه اسکرپرهای ذخیره شده)")
+    record_parser.add_argument("--fixtures", default=FIXTURE_DIR)
+
+    run_parser = commands.add_parser("run", help="اجرای بنچمارک")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="تعداد صفحات هر اجرا")
+    run_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    run_parser.add_argument("--articles", type=int, default=DEFAULT_ARTICLES_PER_PAGE, help="تعداد خبر هر صفحه مصنوعی")
+    run_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    run_parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    run_parser.add_argument("--synthetic", action="store_true", help="نادیده گرفتن صفحات ضبط شده")
+    run_parser.add_argument("--api-latency", type=float, default=0.0, help="تأخیر شبیه‌سازی شده هر فراخوانی API (ثانیه)")
+    run_parser.add_argument("--no-memory", action="store_true", help="بدون اندازه‌گیری حافظه با tracemalloc")
+    run_parser.add_argument("-o", "--output", help="مسیر گزارش JSON")
+    run_parser.add_argument("--compare", help="گزارش JSON قبلی به عنوان خط مبنا")
+    run_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="حداکثر کندی مجاز نسبت به خط مبنا")
+    args = parser.parse_args(argv)
+    return record(args) if args.command == "record" else run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
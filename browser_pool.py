@@ -0,0 +1,206 @@
+# browser_pool.py
+# استخر مرورگرهای Chrome بدون رابط (headless) که بین اجراها و جلسات Streamlit زنده می‌مانند.
+# به جای `time.sleep` ثابت، آماده بودن صفحه با پایدار شدن DOM/شبکه یا پیدا شدن سلکتور خبرها تشخیص داده می‌شود.
+
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable
+
+import telemetry
+
+try:
+    from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.common.by import By
+    from webdriver_manager.chrome import ChromeDriverManager
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+PAGE_LOAD_TIMEOUT = 30
+READY_TIMEOUT = 15
+STABLE_FOR = 0.75  # مدت زمانی (ثانیه) که DOM و درخواست‌های شبکه باید بدون تغییر بمانند
+POLL_INTERVAL = 0.25
+MAX_USES_PER_DRIVER = 50  # پس از این تعداد صفحه، مرورگر برای جلوگیری از نشت حافظه بازسازی می‌شود
+MAX_DRIVER_AGE = 30 * 60
+
+# امضای وضعیت صفحه: تعداد عناصر DOM، طول متن بدنه و تعداد منابع بارگذاری شده
+_PAGE_SIGNATURE_JS = """
+return [
+    document.readyState,
+    document.getElementsByTagName('*').length,
+    document.body ? document.body.innerText.length : 0,
+    (window.performance && performance.getEntriesByType) ? performance.getEntriesByType('resource').length : 0
+];
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def chromedriver_path() -> str:
+    """نصب/یافتن درایور فقط یک بار در طول عمر پردازه."""
+    return ChromeDriverManager().install()
+
+
+def chrome_options() -> "Options":
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    # منتظر بارگذاری کامل همه منابع نمی‌مانیم؛ آماده بودن را خودمان تشخیص می‌دهیم
+    options.page_load_strategy = 'eager'
+    return options
+
+
+def wait_until_ready(driver, wait_selector: str | None = None, timeout: float = READY_TIMEOUT,
+                     stable_for: float = STABLE_FOR) -> str:
+    """منتظر آماده شدن صفحه می‌ماند و دلیل پایان انتظار را برمی‌گرداند: 'selector'، 'stable' یا 'timeout'."""
+    deadline = time.monotonic() + timeout
+    last_signature, stable_since = None, None
+    while time.monotonic() < deadline:
+        if wait_selector:
+            try:
+                if driver.find_elements(By.CSS_SELECTOR, wait_selector):
+                    return 'selector'
+            except WebDriverException:
+                # سلکتور نامعتبر؛ به تشخیص پایداری DOM بسنده می‌کنیم
+                wait_selector = None
+        state, *signature = driver.execute_script(_PAGE_SIGNATURE_JS)
+        now = time.monotonic()
+        if state != 'loading' and signature == last_signature:
+            if now - stable_since >= stable_for:
+                return 'stable'
+        else:
+            last_signature, stable_since = signature, now
+        time.sleep(POLL_INTERVAL)
+    return 'timeout'
+
+
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.created = time.monotonic()
+        self.uses = 0
+
+    @property
+    def expired(self) -> bool:
+        return self.uses >= MAX_USES_PER_DRIVER or time.monotonic() - self.created >= MAX_DRIVER_AGE
+
+    def alive(self) -> bool:
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """استخر با اندازه محدود از مرورگرهای گرم؛ نمونه‌های خراب یا فرسوده به صورت خودکار جایگزین می‌شوند."""
+
+    def __init__(self, max_size: int = 3, driver_factory=None):
+        if driver_factory is None and not SELENIUM_AVAILABLE:
+            raise RuntimeError("کتابخانه Selenium نصب نشده است.")
+        self.max_size = max_size
+        self._driver_factory = driver_factory or self._create_driver
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._all = set()
+        self.stats = {"created": 0, "recycled": 0, "fetches": 0}
+
+    @staticmethod
+    def _create_driver():
+        driver = webdriver.Chrome(service=ChromeService(chromedriver_path()), options=chrome_options())
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        return driver
+
+    def _discard(self, pooled: _PooledDriver):
+        with self._lock:
+            self._all.discard(pooled)
+            self.stats["recycled"] += 1
+        pooled.quit()
+
+    def _checkout(self) -> _PooledDriver:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                pooled = _PooledDriver(self._driver_factory())
+                with self._lock:
+                    self._all.add(pooled)
+                    self.stats["created"] += 1
+                return pooled
+            if not pooled.expired and pooled.alive():
+                return pooled
+            self._discard(pooled)
+
+    @contextmanager
+    def driver(self, timeout: float | None = None):
+        """یک مرورگر از استخر قرض می‌گیرد؛ در صورت خطای WebDriver نمونه دور انداخته می‌شود."""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("هیچ مرورگر آزادی در استخر موجود نیست.")
+        pooled = None
+        try:
+            pooled = self._checkout()
+            yield pooled.driver
+        except WebDriverException:
+            if pooled is not None:
+                self._discard(pooled)
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                pooled.uses += 1
+                if pooled.expired: self._discard(pooled)
+                else: self._idle.put(pooled)
+            self._slots.release()
+
+    def fetch(self, url: str, wait_selector: str | None = None, ready_timeout: float = READY_TIMEOUT) -> str:
+        with telemetry.span('selenium', url=url, wait_selector=wait_selector) as span, self.driver() as driver:
+            try:
+                driver.get(url)
+            except TimeoutException:
+                # صفحه در زمان مقرر کامل نشد؛ با محتوای بارگذاری شده تا این لحظه ادامه می‌دهیم
+                span.set(load_timeout=True)
+            wait_until_ready(driver, wait_selector, timeout=ready_timeout)
+            html = driver.page_source
+            span.set(bytes=len(html))
+            # پاک کردن وضعیت صفحه قبلی پیش از بازگرداندن مرورگر به استخر
+            driver.get("about:blank")
+        with self._lock:
+            self.stats["fetches"] += 1
+        return html
+
+    def fetch_many(self, urls: Iterable[str], wait_selectors: dict | None = None) -> dict:
+        """دریافت هم‌زمان چند صفحه با همه مرورگرهای استخر. خروجی: {url: html یا Exception}."""
+        urls = list(urls)
+        wait_selectors = wait_selectors or {}
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_size) as executor:
+            futures = {url: telemetry.submit(executor, self.fetch, url, wait_selectors.get(url)) for url in urls}
+            for url, future in futures.items():
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    results[url] = e
+        return results
+
+    def close(self):
+        with self._lock:
+            drivers, self._all = list(self._all), set()
+        for pooled in drivers: pooled.quit()
+        while not self._idle.empty():
+            self._idle.get_nowait()
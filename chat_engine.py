@@ -0,0 +1,155 @@
+# chat_engine.py
+# ابزارهای مسیر چت: تشخیص محلی نوع سؤال (بدون فراخوانی مدل در موارد واضح)، کش پاسخ‌ها،
+# embedding پیش‌دستانه سؤال و دریافت جریانی پاسخ مدل.
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
+import telemetry
+from embeddings import embed_query
+from text_normalize import normalize_text, phrase_hits
+
+RETRIEVAL = 'retrieval'
+AGGREGATION = 'aggregation'
+
+# نشانه‌های سؤال تجمیعی (فهرست، شمارش، خلاصه) و سؤال جستجوی محتوای خاص
+_AGGREGATION_CUES = (
+    'لیست', 'فهرست', 'همه', 'تمام', 'تمامی', 'کل', 'چند', 'چندتا', 'تعداد', 'چه تعداد', 'خلاصه', 'جمع بندی',
+    'جمعبندی', 'دسته بندی', 'دستهبندی', 'تیتر', 'تیترها', 'عناوین', 'عنوانها', 'مهمترین', 'مهم ترین', 'مرور', 'اخبار امروز',
+    'list', 'all', 'every', 'how many', 'count', 'number of', 'summary', 'summarize', 'summarise', 'overview',
+    'headlines', 'titles', 'category', 'categories', 'categorize', 'categorise',
+)
+_RETRIEVAL_CUES = (
+    'چه گفت', 'گفته', 'چرا', 'چگونه', 'چطور', 'کی ', 'چه کسی', 'کجا', 'کدام', 'درباره', 'در مورد', 'جزئیات',
+    'توضیح', 'ماجرای', 'نظر', 'واکنش', 'what did', 'who', 'why', 'when', 'where', 'which', 'about', 'details',
+    'explain', 'said',
+)
+CONFIDENT_MARGIN = 1
+
+
+def classify_intent_locally(query: str) -> str | None:
+    """تشخیص نوع سؤال با قواعد کلیدواژه‌ای؛ اگر مطمئن نباشد None برمی‌گرداند تا از مدل استفاده شود."""
+    text = normalize_text(query)
+    aggregation, retrieval = phrase_hits(text, _AGGREGATION_CUES), phrase_hits(text, _RETRIEVAL_CUES)
+    if aggregation - retrieval >= CONFIDENT_MARGIN and retrieval == 0: return AGGREGATION
+    if retrieval - aggregation >= CONFIDENT_MARGIN and aggregation == 0: return RETRIEVAL
+    return None
+
+
+def format_context(contents: list) -> str:
+    """متن سندهای یافت شده برای پرامپت پاسخ؛ رشته خالی اگر سندی پیدا نشده باشد."""
+    if not contents: return ""
+    return "### متون مرتبط از اخبار استخراج شده:\n\n" + "".join(content + "\n---\n" for content in contents)
+
+
+def retrieval_prompt(query: str, context: str) -> str:
+    return f"""You are a helpful AI assistant. Answer the user's question in Persian based ONLY on the provided context.
+                                        **CRITICAL: When you mention a news item, you MUST provide its source link, which is included in the context. Format the link as a clickable Markdown link, like this: [متن لینک](URL).**
+                                        If the answer isn't in the context, say so clearly.
+
+                                        Context:
+                                        {context}
+                                    
+                                        Question: {query}
+                                        """
+
+
+def intent_prompt(query: str) -> str:
+    return f"""Classify the user's query into 'retrieval' or 'aggregation'.
+                        - 'retrieval': Asks about specific content (e.g., "What did the coach say?").
+                        - 'aggregation': Asks for a list, summary, or count (e.g., "List all headlines", "How many news items?").
+                        Query: "{query}" -> Category:"""
+
+
+def parse_intent(model_output: str) -> str:
+    return AGGREGATION if AGGREGATION in model_output.strip().lower() else RETRIEVAL
+
+
+def data_version(scraped_data: list | None) -> str:
+    """نسخه داده‌ها بر اساس محتوای خبرها؛ با هر تغییر در داده‌ها، پاسخ‌های کش شده قبلی استفاده نمی‌شوند."""
+    digest = hashlib.sha256()
+    for item in scraped_data or []:
+        digest.update(f"{item.get('link')}\0{item.get('title')}\0{item.get('description')}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """کش LRU پاسخ‌ها با کلید (دامنه، نسخه داده، سؤال نرمال شده)؛ بین همه جلسات مشترک است."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(domain: str | None, version: str, question: str) -> tuple:
+        return domain or '', version, normalize_text(question)
+
+    def get(self, domain: str | None, version: str, question: str) -> str | None:
+        key = self.key(domain, version, question)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, domain: str | None, version: str, question: str, answer: str):
+        key = self.key(domain, version, question)
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache()
+# نتیجه تشخیص نوع سؤال توسط مدل نیز کش می‌شود (مستقل از داده‌ها)
+_intent_cache = ResponseCache(max_entries=4096)
+
+
+def classify_intent(query: str, generation_model) -> tuple[str, str]:
+    """خروجی: (نوع سؤال، منبع تشخیص: 'local'، 'cache' یا 'llm')."""
+    intent = classify_intent_locally(query)
+    if intent: return intent, 'local'
+    cached = _intent_cache.get(None, '', query)
+    if cached: return cached, 'cache'
+    with telemetry.span('chat.intent') as span:
+        response = generation_model.generate_content(intent_prompt(query))
+        telemetry.record_usage(span, response)
+    intent = parse_intent(response.text)
+    _intent_cache.put(None, '', query, intent)
+    return intent, 'llm'
+
+
+# --- اجرای موازی و پاسخ جریانی ---
+_speculative_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-speculative")
+
+
+def start_query_embedding(query: str) -> Future:
+    """embedding سؤال به صورت پیش‌دستانه و هم‌زمان با تشخیص نوع سؤال شروع می‌شود."""
+    return telemetry.submit(_speculative_executor, embed_query, query)
+
+
+def stream_text(generation_model, prompt: str) -> Iterator[str]:
+    """متن پاسخ مدل را تکه به تکه (به محض تولید) برمی‌گرداند."""
+    with telemetry.span('chat.generate') as span:
+        started = time.perf_counter()
+        response = generation_model.generate_content(prompt, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # تکه‌های بدون متن (مثلاً فقط حاوی اطلاعات ایمنی)
+                continue
+            if text:
+                if 'first_token_seconds' not in span.attributes: span.set(first_token_seconds=time.perf_counter() - started)
+                yield text
+        # در حالت جریانی، مصرف توکن پس از دریافت آخرین تکه روی خود پاسخ در دسترس است
+        telemetry.record_usage(span, response)
@@ -0,0 +1,223 @@
+# crawler.py
+# دریافت هم‌زمان چندین صفحه با اتصال‌های مشترک (keep-alive) و اجرای اسکرپر ذخیره شده هر دامنه.
+# اجرا از خط فرمان:  python crawler.py https://www.dw.com/es/ https://www.france24.com/es/ -o results.jsonl
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import telemetry
+from incremental import IncrementalStore, dedupe_articles, get_store
+from scraper_runtime import run_saved_scraper
+from scraper_store import load_scrapers, record_scraper_run, scraper_hash
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Connection': 'keep-alive',
+}
+DEFAULT_TIMEOUT = 15
+DEFAULT_WORKERS = 16
+DEFAULT_PER_HOST = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_maxsize: int = DEFAULT_WORKERS) -> requests.Session:
+    """یک Session با استخر اتصال به اندازه تعداد کارگرها و تلاش مجدد برای خطاهای موقت."""
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Session مشترک سراسری؛ اتصال‌ها بین کلیک‌ها و اجراهای مختلف دوباره استفاده می‌شوند."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def fetch_url(url: str, session: requests.Session | None = None, timeout: int = DEFAULT_TIMEOUT) -> str:
+    with telemetry.span('fetch', url=url) as span:
+        response = (session or get_session()).get(url, timeout=timeout)
+        span.set(status=response.status_code, bytes=len(response.content))
+        response.raise_for_status()
+        return response.text
+
+
+def fetch_url_conditional(url: str, headers: dict, session: requests.Session | None = None,
+                          timeout: int = DEFAULT_TIMEOUT) -> tuple[str | None, dict]:
+    """درخواست شرطی؛ در پاسخ 304 متن None است. خروجی دوم اعتبارسنج‌های پاسخ (etag, last_modified) است."""
+    with telemetry.span('fetch', url=url, conditional=bool(headers)) as span:
+        response = (session or get_session()).get(url, headers=headers, timeout=timeout)
+        span.set(status=response.status_code, bytes=len(response.content))
+        if response.status_code == 304:
+            return None, {}
+        response.raise_for_status()
+        return response.text, {"etag": response.headers.get('ETag'), "last_modified": response.headers.get('Last-Modified')}
+
+
+@dataclass
+class CrawlResult:
+    url: str
+    domain: str
+    articles: list = field(default_factory=list)
+    html: str | None = None
+    error: str | None = None
+    fetch_seconds: float = 0.0
+    scrape_seconds: float = 0.0
+    not_modified: bool = False
+    new_articles: list | None = None  # فقط در حالت افزایشی: خبرهای جدید یا تغییر یافته
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_dict(self, include_html: bool = False) -> dict:
+        data = {
+            "url": self.url, "domain": self.domain, "ok": self.ok, "error": self.error,
+            "count": len(self.articles), "fetch_seconds": round(self.fetch_seconds, 3),
+            "scrape_seconds": round(self.scrape_seconds, 3), "articles": self.articles,
+        }
+        if self.new_articles is not None:
+            data.update({"not_modified": self.not_modified, "new_count": len(self.new_articles), "new_articles": self.new_articles})
+        if include_html: data["html"] = self.html
+        return data
+
+
+class HostLimiter:
+    """محدود کردن تعداد درخواست‌های هم‌زمان به هر میزبان."""
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+def _crawl_one(url: str, scrapers: dict, session: requests.Session, limiter: HostLimiter, timeout: int,
+               store: IncrementalStore | None = None) -> CrawlResult:
+    domain = urlparse(url).netloc
+    result = CrawlResult(url=url, domain=domain)
+    scraper = scrapers.get(domain)
+    digest = scraper_hash(scraper) if scraper else None
+    validators = {}
+    started = time.perf_counter()
+    try:
+        with limiter(domain):
+            if store is not None and scraper:
+                headers = store.conditional_headers(url, digest)
+                result.html, validators = fetch_url_conditional(url, headers, session=session, timeout=timeout)
+            else:
+                result.html = fetch_url(url, session=session, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        result.error = f"fetch: {e}"
+        return result
+    finally:
+        result.fetch_seconds = time.perf_counter() - started
+
+    if not scraper:
+        result.error = f"no saved scraper for {domain}"
+        return result
+    if result.html is None:
+        # 304: صفحه تغییری نکرده؛ نتایج اجرای قبلی بدون اجرای اسکرپر برگردانده می‌شوند
+        result.not_modified = True
+        result.articles, result.new_articles = store.latest_articles(domain, url), []
+        return result
+    started = time.perf_counter()
+    try:
+        articles = run_saved_scraper(result.html, scraper, domain) or []
+        for item in articles:
+            if isinstance(item, dict): item.setdefault('source', domain)
+        result.articles = articles
+        if store is not None:
+            result.articles = dedupe_articles(articles)
+            result.new_articles = store.record_articles(domain, articles, url)
+            store.save_validators(url, validators.get('etag'), validators.get('last_modified'), digest)
+    except Exception as e:
+        result.error = f"scrape: {e}"
+    finally:
+        result.scrape_seconds = time.perf_counter() - started
+    record_scraper_run(domain, len(result.articles), result.scrape_seconds, ok=result.error is None)
+    return result
+
+
+def crawl_many(urls: Iterable[str], scrapers: dict | None = None, max_workers: int = DEFAULT_WORKERS,
+               per_host: int = DEFAULT_PER_HOST, timeout: int = DEFAULT_TIMEOUT,
+               session: requests.Session | None = None, incremental: bool = False) -> Iterator[CrawlResult]:
+    """دریافت و استخراج هم‌زمان؛ نتیجه هر سایت به محض آماده شدن برگردانده می‌شود (نه به ترتیب ورودی).
+    در حالت افزایشی درخواست‌ها شرطی هستند و `new_articles` فقط خبرهای جدید یا تغییر یافته را دارد."""
+    urls = list(dict.fromkeys(u.strip() for u in urls if u and u.strip()))
+    if not urls: return
+    scrapers = load_scrapers() if scrapers is None else scrapers
+    session = session or get_session()
+    limiter = HostLimiter(per_host)
+    store = get_store() if incremental else None
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        futures = [telemetry.submit(executor, _crawl_one, url, scrapers, session, limiter, timeout, store) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="دریافت دسته‌ای صفحات خبری و اجرای اسکرپرهای ذخیره شده.")
+    parser.add_argument("urls", nargs="*", help="آدرس صفحات")
+    parser.add_argument("-f", "--file", help="فایل متنی شامل آدرس‌ها (هر خط یک آدرس)")
+    parser.add_argument("-o", "--output", help="مسیر خروجی JSON Lines (پیش‌فرض: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST)
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--incremental", action="store_true", help="درخواست شرطی و گزارش فقط خبرهای جدید")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            urls += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    if not urls:
+        parser.error("هیچ آدرسی وارد نشده است.")
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    failures = 0
+    try:
+        session = create_session(args.workers)
+        for result in crawl_many(urls, max_workers=args.workers, per_host=args.per_host, timeout=args.timeout,
+                                 session=session, incremental=args.incremental):
+            failures += not result.ok
+            out.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+            out.flush()
+            status = 'NOT MODIFIED' if result.not_modified else ('OK' if result.ok else 'FAIL')
+            new_info = f", {len(result.new_articles)} new" if result.new_articles is not None else ""
+            print(f"[{status}] {result.url} -> {len(result.articles)} items{new_info}"
+                  f" ({result.fetch_seconds:.2f}s fetch){'' if result.ok else ' ' + result.error}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout: out.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
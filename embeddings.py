@@ -0,0 +1,161 @@
+# embeddings.py
+# ساخت embedding با کش دائمی روی دیسک (کلید: هش متن + نام مدل) و محدودکننده نرخ تطبیقی.
+# فقط متن‌های جدید یا تغییر یافته به API ارسال می‌شوند؛ به جای `time.sleep` ثابت، از سطل توکن و عقب‌نشینی روی 429 استفاده می‌شود.
+
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import google.generativeai as genai
+import numpy as np
+
+import telemetry
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    _RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+except ImportError:
+    _RATE_LIMIT_ERRORS = ()
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_CACHE_FILE = os.path.join('.cache', 'embeddings.sqlite3')
+BATCH_SIZE = 100
+REQUESTS_PER_MINUTE = 60
+MAX_RETRIES = 5
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    if _RATE_LIMIT_ERRORS and isinstance(error, _RATE_LIMIT_ERRORS): return True
+    return "429" in str(error) or "quota" in str(error).lower()
+
+
+class RateLimiter:
+    """سطل توکن برای درخواست‌ها؛ در صورت دریافت 429 نرخ موقتاً کاهش می‌یابد و به تدریج بازمی‌گردد."""
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, burst: int = 5):
+        self.max_rate = requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+    def on_rate_limited(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0.0
+
+    def call(self, func, *args, **kwargs):
+        """اجرای func با رعایت نرخ و تلاش مجدد با عقب‌نشینی نمایی روی خطای 429."""
+        for attempt in range(MAX_RETRIES + 1):
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+                self.on_success()
+                return result
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt == MAX_RETRIES: raise
+                self.on_rate_limited()
+                time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random() / 2))
+
+
+class EmbeddingCache:
+    """کش embedding در SQLite؛ بین اجراها و جلسات مختلف مشترک است."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_FILE):
+        self.path = path
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(text: str, model: str, task_type: str) -> str:
+        return hashlib.sha256(f"{model}\0{task_type}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                found.update({k: np.frombuffer(v, dtype=np.float32) for k, v in rows})
+        return found
+
+    def put_many(self, items: dict):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                   [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()])
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+_default_cache = None
+_default_limiter = RateLimiter()
+_default_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+def embed_texts(texts: list, task_type: str = "RETRIEVAL_DOCUMENT", model: str = EMBEDDING_MODEL,
+                cache: EmbeddingCache | None = None, limiter: RateLimiter | None = None) -> tuple[list, dict]:
+    """embedding متن‌ها به ترتیب ورودی؛ خروجی دوم آمار {'cached', 'embedded', 'batches'} است."""
+    # کش خالی هم معتبر است (EmbeddingCache دارای __len__ است)، پس مقایسه با None انجام می‌شود
+    cache = cache if cache is not None else get_cache()
+    limiter = limiter if limiter is not None else _default_limiter
+    with telemetry.span('embed', task_type=task_type, texts=len(texts)) as span:
+        keys = [EmbeddingCache.key(text, model, task_type) for text in texts]
+        vectors = cache.get_many(list(dict.fromkeys(keys)))
+        missing = list(dict.fromkeys((k, t) for k, t in zip(keys, texts) if k not in vectors))
+        stats = {"cached": len(texts) - sum(1 for k in keys if k not in vectors), "embedded": len(missing), "batches": 0}
+
+        for i in range(0, len(missing), BATCH_SIZE):
+            batch = missing[i:i + BATCH_SIZE]
+            response = limiter.call(genai.embed_content, model=model, content=[t for _, t in batch], task_type=task_type)
+            new_vectors = {k: np.asarray(v, dtype=np.float32) for (k, _), v in zip(batch, response['embedding'])}
+            cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+            stats["batches"] += 1
+            span.add(api_calls=1, embedding_batches=1)
+        span.set(cached=stats["cached"])
+        return [vectors[k] for k in keys], stats
+
+
+def embed_query(query: str, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    vectors, _ = embed_texts([query], task_type="RETRIEVAL_QUERY", model=model)
+    return vectors[0]
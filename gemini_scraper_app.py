@@ -2,27 +2,29 @@
 
 import streamlit as st
 import requests
-from bs4 import BeautifulSoup
 import json
 import google.generativeai as genai
 from urllib.parse import urlparse
 import numpy as np
 import time
-import os
-
-# تلاش برای وارد کردن Selenium
-try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service as ChromeService
-    from selenium.webdriver.chrome.options import Options
-    from webdriver_manager.chrome import ChromeDriverManager
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
+
+import telemetry
+from browser_pool import BrowserPool, SELENIUM_AVAILABLE
+from aggregation import plan_aggregation
+from chat_engine import (classify_intent, data_version, format_context, response_cache, retrieval_prompt,
+                         start_query_embedding, stream_text, AGGREGATION)
+from crawler import crawl_many, fetch_url, fetch_url_conditional
+from incremental import get_store as get_incremental_store, dedupe_articles
+from embeddings import embed_texts, embed_query
+from html_distill import distill_element, parse_html, select_samples
+from vector_index import VectorIndex, document_text, index_lock, index_path, index_version
+from jobs import FETCH_SELENIUM, FETCH_SIMPLE, get_queue
+from scraper_runtime import run_saved_scraper, ScraperError, ScraperTimeout
+from selector_engine import make_spec, is_spec, SpecError
+from scraper_store import get_registry, get_scraper, save_scraper, record_scraper_run, article_selector_for, scraper_hash
 
 # --- بخش تنظیمات و پیکربندی ---
 st.set_page_config(layout="wide", page_title="تحلیلگر هوشمند اخبار با Gemini")
-SCRAPER_FILE = 'scrapers.json'
 
 # --- استایل CSS با فونت شبنم از CDN معتبر ---
 st.markdown(
@@ -74,6 +76,7 @@ if 'scraped_data' not in st.session_state: st.session_state.scraped_data = None
 if 'html_content' not in st.session_state: st.session_state.html_content = None
 if 'current_domain' not in st.session_state: st.session_state.current_domain = None
 if 'scraper_code_to_approve' not in st.session_state: st.session_state.scraper_code_to_approve = None
+if 'telemetry_runs' not in st.session_state: st.session_state.telemetry_runs = []
 
 
 # --- بخش جدید: مدیریت هوشمند کلید API ---
@@ -120,70 +123,68 @@ if st.session_state.gemini_model is None:
         else:
             st.sidebar.warning("لطفاً یک کلید معتبر وارد کنید.")
 
-# --- توابع مدیریت پایگاه داده اسکرپرها ---
-def load_scrapers() -> dict:
-    if not os.path.exists(SCRAPER_FILE): return {}
-    try:
-        with open(SCRAPER_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError): return {}
-
-def save_scraper(domain: str, code: str):
-    scrapers = load_scrapers()
-    scrapers[domain] = code
-    with open(SCRAPER_FILE, 'w', encoding='utf-8') as f:
-        json.dump(scrapers, f, indent=4, ensure_ascii=False)
-
 # --- توابع اصلی برنامه ---
 def fetch_html_simple(url: str):
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        st.session_state.html_content = response.text
+        # استفاده از Session مشترک (keep-alive و فشرده‌سازی) به جای یک اتصال جدید در هر کلیک
+        st.session_state.html_content = fetch_url(url)
     except requests.exceptions.RequestException as e:
         st.error(f"[Requests] خطا در دریافت اطلاعات از سایت: {e}")
         st.session_state.html_content = None
 
-def fetch_html_advanced(url: str):
+def fetch_html_conditional(url: str, saved_scraper) -> tuple[bool, dict]:
+    """درخواست شرطی با ETag/Last-Modified ذخیره شده. خروجی: (آیا صفحه تغییر نکرده، اعتبارسنج‌های پاسخ)."""
+    headers = get_incremental_store().conditional_headers(url, scraper_hash(saved_scraper))
+    try:
+        html_content, validators = fetch_url_conditional(url, headers)
+    except requests.exceptions.RequestException as e:
+        st.error(f"[Requests] خطا در دریافت اطلاعات از سایت: {e}")
+        st.session_state.html_content = None
+        return False, {}
+    st.session_state.html_content = html_content
+    return html_content is None, validators
+
+@st.cache_resource(show_spinner=False)
+def get_browser_pool() -> BrowserPool:
+    """استخر مرورگرهای گرم که بین همه جلسات Streamlit مشترک است."""
+    return BrowserPool(max_size=2)
+
+def fetch_html_advanced(url: str, wait_selector: str | None = None):
     if not SELENIUM_AVAILABLE:
         st.error("کتابخانه Selenium نصب نشده است.")
         st.session_state.html_content = None
         return
-    driver = None
     status = st.status("در حال اجرای مرورگر خودکار (Selenium)...", expanded=True)
     try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        status.write("نصب یا به‌روزرسانی درایور مرورگر...")
-        service = ChromeService(ChromeDriverManager().install())
         status.write(f"باز کردن آدرس: {url}")
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.set_page_load_timeout(30)
-        driver.get(url)
-        status.write("منتظر ماندن برای بارگذاری محتوای دینامیک...")
-        time.sleep(7)
-        html_content = driver.page_source
+        if wait_selector:
+            status.write(f"منتظر ماندن برای نمایش خبرها (`{wait_selector}`) یا پایدار شدن صفحه...")
+        else:
+            status.write("منتظر ماندن برای پایدار شدن محتوای دینامیک...")
+        html_content = get_browser_pool().fetch(url, wait_selector=wait_selector)
         status.update(label="مرورگر خودکار با موفقیت کار خود را تمام کرد.", state="complete")
         st.session_state.html_content = html_content
     except Exception as e:
         st.error(f"[Selenium] خطا در اجرای مرورگر خودکار: {e}")
         status.update(label="خطا در اجرای Selenium.", state="error")
         st.session_state.html_content = None
-    finally:
-        if driver:
-            driver.quit()
 
-def generate_scraper_with_gemini(html_content: str, site_url: str) -> str | None:
+def generate_scraper_with_gemini(html_content: str, site_url: str, as_spec: bool = False) -> str | dict | None:
+    """با as_spec=True خروجی مرحله ۲ به صورت مشخصات سلکتور برگردانده می‌شود و مرحله ۳ (تولید کد) حذف می‌شود."""
     generation_model = st.session_state.gemini_model
-    soup = BeautifulSoup(html_content, 'lxml')
-    body_content_sample = str(soup.body.prettify())[:100000] if soup.body else ""
     status = st.status("در حال اجرای تحلیل متخصصانه توسط Gemini...", expanded=True)
     try:
+        # صفحه یک بار پارس می‌شود؛ به جای prettify، نسخه خلاصه شده (بدون اسکریپت، استایل و ویژگی‌های زائد) ارسال می‌شود
+        root = parse_html(html_content)
+        body = root.find('body')
+        body_content_sample = distill_element(body) if body is not None else ""
+        status.write(f"HTML از {len(html_content):,} به {len(body_content_sample):,} کاراکتر خلاصه شد.")
+
         status.update(label="مرحله ۱: نقشه‌برداری از ساختار کلی سایت...")
         prompt_step_1 = f"""Analyze the following HTML from {site_url}. Identify CSS selectors for the main containers that each hold a single news article. Provide your answer as a JSON object with a key "selectors" which is a list of strings. Example: {{"selectors": ["div.story-wrapper", "a.news-card"]}} \nHTML:\n```html\n{body_content_sample}\n```"""
-        response_step_1 = generation_model.generate_content(prompt_step_1)
+        with telemetry.span('generate.step1', model=getattr(generation_model, 'model_name', None), prompt_chars=len(prompt_step_1)) as span:
+            response_step_1 = generation_model.generate_content(prompt_step_1)
+            telemetry.record_usage(span, response_step_1)
         selectors_json_str = response_step_1.text.strip().replace("```json", "").replace("```", "").strip()
         candidate_selectors = json.loads(selectors_json_str).get("selectors", [])
         if not candidate_selectors: return None
@@ -191,17 +192,26 @@ def generate_scraper_with_gemini(html_content: str, site_url: str) -> str | None
         
         status.update(label="مرحله ۲: تحلیل عمیق و مقایسه‌ای نمونه‌ها...")
         samples_html = ""
-        found_articles = soup.select(", ".join(candidate_selectors), limit=5)
+        found_articles = select_samples(root, candidate_selectors, limit=5)
         if not found_articles: return None
-        for article in found_articles: samples_html += f"<!-- Sample Article Container -->\n{article.prettify()}\n\n"
+        for article in found_articles: samples_html += f"<!-- Sample Article Container -->\n{distill_element(article, max_chars=8000)}\n\n"
         prompt_step_2 = f"""Based on the HTML samples, determine reliable CSS selectors to extract title, link, and description. Provide analysis as a clean JSON object with keys: "best_article_selector", "title_selector", "link_selector", "description_selector". If the link is on the main container itself, use "self".\nHTML SAMPLES:\n```html\n{samples_html}\n```"""
-        response_step_2 = generation_model.generate_content(prompt_step_2)
+        with telemetry.span('generate.step2', model=getattr(generation_model, 'model_name', None), prompt_chars=len(prompt_step_2)) as span:
+            response_step_2 = generation_model.generate_content(prompt_step_2)
+            telemetry.record_usage(span, response_step_2)
         analysis = json.loads(response_step_2.text.strip().replace("```json", "").replace("```", "").strip())
         status.write("مرحله ۲: تحلیل ساختار داخلی مقالات با موفقیت انجام شد.")
 
+        if as_spec:
+            spec = make_spec(analysis, site_url)
+            status.update(label="تحلیل متخصصانه با موفقیت به پایان رسید (اسکرپر مبتنی بر سلکتور).", state="complete")
+            return spec
+
         status.update(label="مرحله ۳: تولید کد نهایی...")
         prompt_step_3 = f"""Write a Python function `scrape_news(html_content)` using this analysis: `{json.dumps(analysis)}`. Base URL: `{site_url}`. CRITICAL: Must include `from bs4 import BeautifulSoup` and `from urllib.parse import urljoin`. Use `try-except Exception: continue`. Return ONLY Python code."""
-        response_step_3 = generation_model.generate_content(prompt_step_3)
+        with telemetry.span('generate.step3', model=getattr(generation_model, 'model_name', None), prompt_chars=len(prompt_step_3)) as span:
+            response_step_3 = generation_model.generate_content(prompt_step_3)
+            telemetry.record_usage(span, response_step_3)
         final_code = response_step_3.text.strip().replace("```python", "").replace("```", "").strip()
         status.update(label="تحلیل متخصصانه و تولید کد با موفقیت به پایان رسید!", state="complete")
         return final_code
@@ -210,66 +220,166 @@ def generate_scraper_with_gemini(html_content: str, site_url: str) -> str | None
         st.error(f"خطا در فرآیند تحلیل چند مرحله‌ای: {e}")
         return None
 
-def execute_scraper(html_content: str, scraper_code: str) -> list | None:
+def execute_scraper(html_content: str, scraper_code: str | dict) -> list | None:
+    # کد پایتون در استخر پردازه جداگانه با محدودیت زمان و حافظه اجرا می‌شود تا کد معیوب برنامه را قفل نکند
     try:
-        execution_scope = {}
-        exec(scraper_code, execution_scope)
-        scraper_function = execution_scope.get('scrape_news')
-        if callable(scraper_function):
-            return scraper_function(html_content)
-        st.error("تابع `scrape_news` در کد تولید شده یافت نشد.")
+        return run_saved_scraper(html_content, scraper_code)
+    except SpecError as e:
+        st.error(f"مشخصات سلکتور نامعتبر است: {e}")
+        return None
+    except ScraperTimeout as e:
+        st.error(f"اجرای کد استخراج‌کننده متوقف شد: {e}")
+        return None
+    except ScraperError as e:
+        st.error(f"خطا در اجرای کد استخراج‌کننده: {e}")
         return None
     except Exception as e:
         st.error(f"خطا در اجرای کد استخراج‌کننده: {e}")
         return None
 
-def build_vector_store(scraped_data: list):
-    st.session_state.vector_store = []
-    if not scraped_data: return
-    items_to_embed = [item for item in scraped_data if item.get('title') and item.get('link')]
-    if not items_to_embed: return
-
-    # --- اصلاح کلیدی برای رفع باگ لینک ---
-    # لینک خبر را به متنی که embed می‌شود اضافه می‌کنیم تا در پایگاه دانش برای جستجو و پاسخگویی موجود باشد.
-    contents = [f"عنوان: {item.get('title', '')}\nتوضیحات: {item.get('description', '')}\nمنبع (لینک): {item.get('link', '')}" for item in items_to_embed]
-    
+def embed_items(items: list) -> tuple[list, dict] | None:
+    """embedding متن خبرها (با کش روی دیسک)؛ در صورت خطا پیام نمایش داده شده و None برگردانده می‌شود."""
+    if not items: return [], {"cached": 0, "embedded": 0, "batches": 0}
+    # لینک خبر داخل متن embed شده است تا در پایگاه دانش برای جستجو و پاسخگویی موجود باشد (vector_index.document_text)
+    contents = [document_text(item) for item in items]
     with st.spinner(f"در حال آماده‌سازی دانش برای چت‌بات (پردازش {len(contents)} خبر)..."):
         try:
-            BATCH_SIZE = 100
-            all_embeddings = []
-            for i in range(0, len(contents), BATCH_SIZE):
-                batch_content = contents[i:i+BATCH_SIZE]
-                embedding_response = genai.embed_content(model="models/text-embedding-004", content=batch_content, task_type="RETRIEVAL_DOCUMENT")
-                all_embeddings.extend(embedding_response['embedding'])
-                time.sleep(1) # برای جلوگیری از خطاهای rate limit
-            
-            for content, vector in zip(contents, all_embeddings):
-                st.session_state.vector_store.append({"content": content, "vector": np.array(vector)})
-            st.success(f"پایگاه دانش چت‌بات با **{len(st.session_state.vector_store)}** سند آماده شد.")
+            # فقط خبرهای جدید یا تغییر یافته به API ارسال می‌شوند؛ بقیه از کش روی دیسک خوانده می‌شوند
+            return embed_texts(contents, task_type="RETRIEVAL_DOCUMENT")
         except Exception as e:
             st.error(f"خطا در ساخت embedding: {e}")
+            return None
+
+def add_to_index(index: VectorIndex, items: list, vectors: list):
+    if not items: return
+    with telemetry.span('index', documents=len(items)):
+        # شاخص واژگانی BM25 همراه با بردارها در VectorIndex.add ساخته می‌شود
+        index.add(np.vstack(vectors), [document_text(item) for item in items],
+                  [{"link": item.get('link'), "source": item.get('source')} for item in items])
 
-def find_relevant_context(query: str, top_k: int = 7) -> str:
+def build_vector_store(scraped_data: list, append: bool = False):
+    """فقط خبرهای جدید یا تغییر یافته نسبت به شاخص embedding می‌شوند و سطر قبلی خبر تغییر یافته جایگزین می‌شود.
+    شاخص دامنه روی دیسک زیر index_lock از نو بارگذاری و ادغام می‌شود تا سطرهای کارگرهای پس‌زمینه یا جلسه‌های دیگر
+    از دست نروند؛ بدون دامنه (اجرای دسته‌ای) شاخص فقط در جلسه است و با append=False از نو ساخته می‌شود."""
+    items = [item for item in scraped_data or [] if item.get('title') and item.get('link')]
+    domain = st.session_state.current_domain
+    if domain:
+        # embedding (درخواست‌های شبکه و انتظار محدودیت نرخ) بیرون از قفل انجام می‌شود تا نویسنده‌های دیگر منتظر نمانند
+        index = VectorIndex.load(index_path(domain))
+        embedded = embed_items(index.pending(items) if index is not None else items)
+        if embedded is not None:
+            with index_lock(domain):
+                index = VectorIndex.load(index_path(domain), mmap=False) or VectorIndex()
+                pending = index.pending(items)
+                if pending:
+                    try:
+                        # همان متن‌ها بالاتر embed شده‌اند و از کش خوانده می‌شوند
+                        vectors, _ = embed_texts([document_text(item) for item in pending], task_type="RETRIEVAL_DOCUMENT")
+                        add_to_index(index, pending, vectors)
+                        # ذخیره شاخص دامنه روی دیسک تا پس از راه‌اندازی مجدد و در جلسات دیگر قابل استفاده باشد
+                        index.save(index_path(domain))
+                    except Exception as e:
+                        st.error(f"خطا در ساخت embedding: {e}")
+                        embedded = None
+    else:
+        index = st.session_state.vector_store if append and st.session_state.vector_store is not None else VectorIndex()
+        pending = index.pending(items)
+        embedded = embed_items(pending)
+        if embedded is not None: add_to_index(index, pending, embedded[0])
+    if embedded is not None:
+        stats = embedded[1]
+        st.success(f"پایگاه دانش چت‌بات با **{len(index)}** سند آماده شد "
+                   f"({stats['cached']} از کش، {stats['embedded']} embedding جدید).")
+    st.session_state.vector_store = index
+
+def find_relevant_context(query: str, top_k: int = 7, query_vector: np.ndarray | None = None,
+                          lexical_only: bool = False) -> str:
+    """query_vector در صورت وجود، embedding از پیش محاسبه شده سؤال است (مسیر پیش‌دستانه چت).
+    با lexical_only=True (تطابق واژگانی قوی) فقط جستجوی BM25 انجام شده و embedding سؤال محاسبه نمی‌شود."""
     if not st.session_state.vector_store: return ""
     try:
-        query_embedding = genai.embed_content(model="models/text-embedding-004", content=query, task_type="RETRIEVAL_QUERY")['embedding']
-        query_vector = np.array(query_embedding)
-        vectors = np.array([item['vector'] for item in st.session_state.vector_store])
-        
-        # محاسبه شباهت کسینوسی
-        dot_products = np.dot(vectors, query_vector)
-        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
-        similarities = dot_products / norms
-        
-        top_k_indices = np.argsort(similarities)[-top_k:][::-1]
-        context = "### متون مرتبط از اخبار استخراج شده:\n\n"
-        for index in top_k_indices:
-            context += st.session_state.vector_store[index]['content'] + "\n---\n"
-        return context
+        # جستجوی ترکیبی: شباهت کسینوسی (یک ضرب ماتریس در بردار) و BM25 با ترکیب رتبه‌ها (RRF)
+        index = st.session_state.vector_store
+        if query_vector is None and not lexical_only: query_vector = embed_query(query)
+        with telemetry.span('search', documents=len(index), mode='lexical' if lexical_only else 'hybrid'):
+            results = index.hybrid_search(query, None if lexical_only else query_vector, top_k=top_k)
+        return format_context([index.contents[doc_id] for doc_id, _score in results])
     except Exception as e:
         st.error(f"خطا در پیدا کردن متن مرتبط: {e}")
         return ""
 
+# --- نتایج مشترک کارگرهای پس‌زمینه (worker.py) ---
+SHARED_FRESH_SECONDS = 600  # نتایج کارگرها تا این مدت تازه محسوب شده و به جای پردازش مجدد استفاده می‌شوند
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def load_shared_index(domain: str, version: float) -> VectorIndex | None:
+    # بین همه جلسات مشترک است (فقط خواندنی، memory-map)؛ با ذخیره جدید شاخص، version تغییر کرده و دوباره بارگذاری می‌شود
+    return VectorIndex.load(index_path(domain))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def load_shared_articles(domain: str, url: str, version: float | None) -> list:
+    return get_incremental_store().latest_articles(domain, url)
+
+def load_shared_results(domain: str, url: str) -> bool:
+    """بارگذاری آخرین خبرهای آدرس url و شاخص برداری دامنه از مخزن مشترک در جلسه فعلی."""
+    articles = load_shared_articles(domain, url, get_queue().last_success(domain, url))
+    if not articles: return False
+    version = index_version(domain)
+    st.session_state.messages, st.session_state.scraper_code_to_approve, st.session_state.html_content = [], None, None
+    st.session_state.current_domain, st.session_state.scraped_data = domain, articles
+    st.session_state.vector_store = load_shared_index(domain, version) if version else None
+    return True
+
+@st.fragment(run_every=5)
+def render_job_status(domain: str | None):
+    """وضعیت صف هر چند ثانیه یک بار فقط در همین بخش به‌روز می‌شود؛ بقیه صفحه اجرا نمی‌شود."""
+    queue = get_queue()
+    counts = queue.counts()
+    st.caption(" | ".join(f"{status}: {counts.get(status, 0)}" for status in ('queued', 'running', 'done', 'failed')))
+    jobs = queue.recent(10, domain=domain)
+    if jobs:
+        st.dataframe([{'#': job.id, 'وضعیت': job.status, 'آدرس': job.url, 'روش': job.fetch_method,
+                       'خبر جدید': (job.result or {}).get('new_items'), 'خطا': job.error,
+                       'پایان': time.strftime('%H:%M:%S', time.localtime(job.finished_at)) if job.finished_at else None}
+                      for job in jobs], hide_index=True)
+    for schedule in queue.schedules():
+        if domain and urlparse(schedule['url']).netloc != domain: continue
+        st.caption(f"🔁 `{schedule['url']}` هر {schedule['interval_seconds'] / 60:.0f} دقیقه؛ اجرای بعدی "
+                   f"{time.strftime('%H:%M', time.localtime(schedule['next_run_at']))}")
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_server():
+    # یک سرور /metrics برای کل پردازه؛ بین همه جلسات مشترک است
+    return telemetry.start_metrics_server()
+
+def remember_run(run: telemetry.Run, keep: int = 20):
+    if run.spans:
+        st.session_state.telemetry_runs = (st.session_state.telemetry_runs + [run])[-keep:]
+
+def render_telemetry_panel():
+    """پنل کناری زمان و هزینه هر مرحله برای اجراهای اخیر."""
+    st.sidebar.header("⏱️ زمان‌بندی و هزینه")
+    runs = st.session_state.telemetry_runs
+    server = get_metrics_server()
+    if server is not None:
+        st.sidebar.caption(f"متریک‌های Prometheus: `http://{server.server_address[0]}:{server.server_address[1]}/metrics`")
+    if not runs:
+        st.sidebar.caption("هنوز اجرایی ثبت نشده است.")
+        return
+    labels = {f"{time.strftime('%H:%M:%S', time.localtime(run.started_at))} | {run.label}": run for run in reversed(runs)}
+    # بدون key: با اضافه شدن اجرای جدید، گزینه‌ها تغییر کرده و جدیدترین اجرا انتخاب می‌شود
+    run = labels[st.sidebar.selectbox("اجرا:", list(labels))]
+    totals = run.totals()
+    c1, c2 = st.sidebar.columns(2)
+    c1.metric("زمان کل", f"{run.seconds:.2f} ث")
+    c2.metric("فراخوانی API", totals['api_calls'])
+    c1.metric("توکن ورودی", f"{totals['prompt_tokens']:,}")
+    c2.metric("توکن خروجی", f"{totals['output_tokens']:,}")
+    if totals['embedding_batches']: st.sidebar.caption(f"دسته‌های embedding: {totals['embedding_batches']}")
+    st.sidebar.dataframe([{**row, 'seconds': round(row['seconds'], 3)} for row in run.by_stage()], hide_index=True)
+    st.sidebar.download_button("📥 دریافت spanها (JSON Lines)", run.to_jsonl(), file_name=f"run-{run.id}.jsonl",
+                               mime="application/jsonl", use_container_width=True)
+
 # --- رابط کاربری اصلی Streamlit ---
 st.title("تحلیلگر هوشمند و پایدار اخبار 🤖📝")
 
@@ -287,50 +397,173 @@ else:
         url = st.text_input("آدرس وب‌سایت:", placeholder="https://www.varzesh3.com/")
         fetch_method = st.radio("روش دریافت:", ('ساده (Requests)', 'پیشرفته (Selenium)'), index=1, horizontal=True)
         force_regenerate = st.checkbox("ساخت مجدد اسکرپر (نادیده گرفتن کد ذخیره شده)")
+        incremental = st.checkbox("پردازش افزایشی (فقط خبرهای جدید)",
+                                  help="با درخواست شرطی، اگر صفحه تغییر نکرده باشد کل پردازش حذف می‌شود و در غیر این صورت فقط خبرهای جدید embedding می‌شوند.")
+        scraper_type = st.radio("نوع اسکرپر جدید:", ('کد پایتون', 'سلکتور (سریع‌تر، بدون مرحله ۳)'), horizontal=True,
+                                help="اسکرپر سلکتوری فقط سلکتورهای CSS را ذخیره کرده و با موتور داخلی lxml اجرا می‌کند.")
 
         if st.button("🚀 شروع پردازش", type="primary", use_container_width=True):
-            if url:
-                # ریست کردن وضعیت برای پردازش جدید
-                st.session_state.messages, st.session_state.vector_store = [], None
-                st.session_state.scraped_data, st.session_state.scraper_code_to_approve = None, None
-                
-                domain = urlparse(url).netloc
-                st.session_state.current_domain = domain
-                scrapers = load_scrapers()
-                fetch_html_advanced(url) if fetch_method == 'پیشرفته (Selenium)' else fetch_html_simple(url)
-
-                if st.session_state.html_content:
-                    st.success("✔️ محتوای HTML دریافت شد.")
-                    if domain in scrapers and not force_regenerate:
-                        st.info(f"✅ اسکرپر ذخیره شده برای `{domain}` اجرا می‌شود...")
-                        scraper_code = scrapers[domain]
-                        st.session_state.scraped_data = execute_scraper(st.session_state.html_content, scraper_code)
+            with telemetry.run(f"پردازش {url}") as current_run:
+                if url:
+                    domain = urlparse(url).netloc
+                    saved_scraper = get_scraper(domain) if not force_regenerate else None
+                    use_incremental = incremental and saved_scraper is not None
+                    last_shared = get_queue().last_success(domain, url) if saved_scraper is not None else None
+
+                    # ریست کردن وضعیت برای پردازش جدید
+                    st.session_state.messages, st.session_state.vector_store = [], None
+                    st.session_state.scraped_data, st.session_state.scraper_code_to_approve = None, None
+                    st.session_state.current_domain = domain
+                    if use_incremental:
+                        # شاخص ذخیره شده دامنه مبنای پردازش افزایشی است
+                        st.session_state.vector_store = VectorIndex.load(index_path(domain))
+
+                    # نتیجه تازه کارگرهای پس‌زمینه (یا کاربر دیگر) وجود دارد؛ همان استفاده می‌شود
+                    loaded_shared = bool(last_shared and time.time() - last_shared < SHARED_FRESH_SECONDS
+                                         and load_shared_results(domain, url))
+                    if loaded_shared:
+                        st.success(f"✔️ نتایج در ساعت {time.strftime('%H:%M', time.localtime(last_shared))} توسط کارگر پس‌زمینه به‌روز شده‌اند و از مخزن مشترک بارگذاری شدند.")
                     else:
-                        st.info(f"در حال ساخت اسکرپر جدید برای `{domain}`...")
-                        generated_code = generate_scraper_with_gemini(st.session_state.html_content, url)
-                        if generated_code:
-                            st.session_state.scraper_code_to_approve = generated_code
+                        not_modified, validators = False, {}
+                        if fetch_method == 'پیشرفته (Selenium)':
+                            fetch_html_advanced(url, wait_selector=article_selector_for(saved_scraper) if saved_scraper else None)
+                        elif use_incremental:
+                            not_modified, validators = fetch_html_conditional(url, saved_scraper)
+                        else:
+                            fetch_html_simple(url)
+
+                        if not_modified:
+                            st.success("✔️ صفحه از آخرین پردازش تغییری نکرده است (304)؛ نتایج قبلی بارگذاری شد.")
+                            st.session_state.scraped_data = get_incremental_store().latest_articles(domain, url)
+                            if st.session_state.vector_store is not None:
+                                # خبرهایی که قبلاً ثبت ولی ایندکس نشده‌اند (مثلاً کار کارگر بدون کلید API)
+                                build_vector_store(st.session_state.scraped_data, append=True)
+                        elif st.session_state.html_content:
+                            st.success("✔️ محتوای HTML دریافت شد.")
+                            if saved_scraper is not None:
+                                st.info(f"✅ اسکرپر ذخیره شده برای `{domain}` اجرا می‌شود...")
+                                started = time.perf_counter()
+                                st.session_state.scraped_data = execute_scraper(st.session_state.html_content, saved_scraper)
+                                record_scraper_run(domain, len(st.session_state.scraped_data or []), time.perf_counter() - started,
+                                                   ok=st.session_state.scraped_data is not None)
+                                if st.session_state.scraped_data is not None:
+                                    # خبرها در هر اجرا ثبت می‌شوند تا اولین پردازش افزایشی بعد از ساخت کامل، همه را جدید نبیند
+                                    store = get_incremental_store()
+                                    new_items = store.record_articles(domain, st.session_state.scraped_data, url)
+                                    if use_incremental:
+                                        store.save_validators(url, validators.get('etag'), validators.get('last_modified'), scraper_hash(saved_scraper))
+                                        st.session_state.scraped_data = dedupe_articles(st.session_state.scraped_data)
+                                        st.info(f"🆕 {len(new_items)} خبر جدید یا تغییر یافته از {len(st.session_state.scraped_data)} خبر.")
+                                        if st.session_state.vector_store is not None:
+                                            # تفاوت با خود شاخص (نه فقط با خبرهای ثبت شده) محاسبه می‌شود: VectorIndex.pending
+                                            build_vector_store(st.session_state.scraped_data, append=True)
+                            else:
+                                st.info(f"در حال ساخت اسکرپر جدید برای `{domain}`...")
+                                started = time.perf_counter()
+                                generated_code = generate_scraper_with_gemini(st.session_state.html_content, url,
+                                                                              as_spec=scraper_type != 'کد پایتون')
+                                st.session_state.generation_seconds = time.perf_counter() - started
+                                if generated_code:
+                                    st.session_state.scraper_code_to_approve = generated_code
+                                else:
+                                    st.error("تولید کد ناموفق بود. ممکن است ساختار سایت پیچیده باشد یا خطایی در API رخ داده باشد.")
                         else:
-                            st.error("تولید کد ناموفق بود. ممکن است ساختار سایت پیچیده باشد یا خطایی در API رخ داده باشد.")
+                            st.error("دریافت HTML ناموفق بود.")
                 else:
-                    st.error("دریافت HTML ناموفق بود.")
-            else:
-                st.warning("لطفاً آدرس را وارد کنید.")
+                    st.warning("لطفاً آدرس را وارد کنید.")
+            remember_run(current_run)
+
+        with st.expander("🛰️ پردازش در پس‌زمینه (کارگرها)"):
+            st.caption("کارها در صف مشترک ثبت و توسط `python worker.py run` اجرا می‌شوند؛ نتایج و شاخص برداری در مخزن مشترک "
+                       "ذخیره شده و برای همه کاربران در دسترس است. رابط کاربری منتظر اتمام کار نمی‌ماند.")
+            background_method = FETCH_SELENIUM if fetch_method == 'پیشرفته (Selenium)' else FETCH_SIMPLE
+            b1, b2 = st.columns(2)
+            if b1.button("📥 افزودن به صف", use_container_width=True, disabled=not url):
+                st.success(f"کار #{get_queue().enqueue(url, background_method)} برای `{url}` در صف است.")
+            if b2.button("📂 بارگذاری نتایج مشترک", use_container_width=True, disabled=not url):
+                if load_shared_results(urlparse(url).netloc, url): st.rerun()
+                st.warning("هنوز نتیجه‌ای برای این دامنه در مخزن مشترک وجود ندارد.")
+            s1, s2 = st.columns([1, 1])
+            interval_minutes = s1.number_input("فاصله (دقیقه):", min_value=5, value=60, step=5)
+            if s2.button("🔁 زمان‌بندی دوره‌ای", use_container_width=True, disabled=not url):
+                get_queue().schedule(url, interval_minutes * 60, background_method)
+                st.success(f"`{url}` هر {interval_minutes} دقیقه به‌روز می‌شود.")
+            render_job_status(urlparse(url).netloc if url else None)
+
+        with st.expander("📚 حالت دسته‌ای (چند سایت به صورت هم‌زمان)"):
+            batch_urls = st.text_area("آدرس‌ها (هر خط یک آدرس):", height=150, key="batch_urls")
+            st.caption("فقط سایت‌هایی که اسکرپر ذخیره شده دارند استخراج می‌شوند. نتیجه هر سایت به محض آماده شدن نمایش داده می‌شود.")
+            if st.button("⚡ اجرای دسته‌ای", use_container_width=True):
+                urls = [line.strip() for line in batch_urls.splitlines() if line.strip()]
+                with telemetry.run(f"اجرای دسته‌ای ({len(urls)} آدرس)") as current_run:
+                    if urls:
+                        st.session_state.messages, st.session_state.vector_store = [], None
+                        st.session_state.scraper_code_to_approve, st.session_state.html_content = None, None
+                        st.session_state.current_domain = None
+                        batch_data = []
+                        progress = st.progress(0.0, text="در حال دریافت...")
+                        for done, result in enumerate(crawl_many(urls), start=1):
+                            if result.ok:
+                                batch_data.extend(result.articles)
+                                st.write(f"✅ `{result.domain}`: {len(result.articles)} خبر ({result.fetch_seconds:.1f} ثانیه)")
+                            else:
+                                st.write(f"❌ `{result.domain}`: {result.error}")
+                            progress.progress(done / len(urls), text=f"{done} از {len(urls)} سایت")
+                        st.session_state.scraped_data = batch_data
+                    else:
+                        st.warning("لطفاً حداقل یک آدرس وارد کنید.")
+                remember_run(current_run)
 
         if st.session_state.get('scraper_code_to_approve'):
             st.subheader("۲. تایید و اصلاح اسکرپر")
-            edited_code = st.text_area("کد اسکرپر:", value=st.session_state.scraper_code_to_approve, height=300, key="editor")
+            pending_scraper = st.session_state.scraper_code_to_approve
+            if is_spec(pending_scraper):
+                edited_text = st.text_area("مشخصات سلکتور (JSON):", value=json.dumps(pending_scraper, indent=2, ensure_ascii=False), height=300, key="editor")
+                try:
+                    edited_code = json.loads(edited_text)
+                except json.JSONDecodeError as e:
+                    st.error(f"JSON نامعتبر است: {e}")
+                    edited_code = pending_scraper
+            else:
+                edited_code = st.text_area("کد اسکرپر:", value=pending_scraper, height=300, key="editor")
             c1, c2 = st.columns(2)
             if c1.button("✅ تست و اجرا", use_container_width=True):
-                with st.spinner("در حال تست کد..."):
+                with st.spinner("در حال تست کد..."), telemetry.run(f"تست اسکرپر {st.session_state.current_domain}") as current_run:
                     st.session_state.scraped_data = execute_scraper(st.session_state.html_content, edited_code)
+                remember_run(current_run)
             if c2.button("💾 ذخیره و آماده‌سازی", type="primary", use_container_width=True, disabled=not bool(st.session_state.scraped_data)):
-                save_scraper(st.session_state.current_domain, edited_code)
-                st.success(f"کد برای `{st.session_state.current_domain}` ذخیره شد.")
-                build_vector_store(st.session_state.scraped_data)
+                version = save_scraper(st.session_state.current_domain, edited_code,
+                                       generation_seconds=st.session_state.get('generation_seconds'))
+                st.success(f"کد برای `{st.session_state.current_domain}` ذخیره شد (نسخه {version}).")
+                get_incremental_store().record_articles(st.session_state.current_domain, st.session_state.scraped_data, url)
+                with telemetry.run(f"ساخت پایگاه دانش {st.session_state.current_domain}") as current_run:
+                    build_vector_store(st.session_state.scraped_data)
+                remember_run(current_run)
                 st.session_state.scraper_code_to_approve = None # پاک کردن کد از حالت تایید
                 st.rerun()
 
+        if st.session_state.current_domain and get_scraper(st.session_state.current_domain) is not None:
+            with st.expander(f"🗂️ اسکرپر ذخیره شده `{st.session_state.current_domain}`: آمار و نسخه‌ها"):
+                registry = get_registry()
+                stats = registry.stats(st.session_state.current_domain)
+                m1, m2, m3 = st.columns(3)
+                m1.metric("نسخه فعلی", stats['version'])
+                m2.metric("اجرای موفق / ناموفق", f"{stats['run_count']} / {stats['failure_count']}")
+                m3.metric("میانگین زمان استخراج", f"{stats['avg_extract_seconds']:.2f} ث" if stats['avg_extract_seconds'] is not None else "-")
+                if stats['last_success']:
+                    st.caption(f"آخرین اجرای موفق: {time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['last_success']))}"
+                               f" با {stats['last_item_count']} خبر")
+                history = registry.history(st.session_state.current_domain)
+                st.dataframe([{**row, 'created_at': time.strftime('%Y-%m-%d %H:%M', time.localtime(row['created_at']))} for row in history])
+                older = [row['version'] for row in history if row['version'] != stats['version']]
+                if older:
+                    r1, r2 = st.columns([2, 1])
+                    target = r1.selectbox("بازگشت به نسخه:", older, key="rollback_version")
+                    if r2.button("↩️ بازگشت", use_container_width=True):
+                        registry.rollback(st.session_state.current_domain, target)
+                        st.success(f"نسخه {target} دوباره فعال شد.")
+                        st.rerun()
+
         if st.session_state.get('scraped_data') is not None:
             st.subheader("نتایج استخراج شده")
             total_items = len(st.session_state.scraped_data)
@@ -339,7 +572,9 @@ else:
                 st.dataframe(st.session_state.scraped_data)
             if not st.session_state.get('vector_store'):
                 if st.button("🧠 آماده‌سازی برای پرسش و پاسخ", use_container_width=True):
-                    build_vector_store(st.session_state.scraped_data)
+                    with telemetry.run("ساخت پایگاه دانش") as current_run:
+                        build_vector_store(st.session_state.scraped_data)
+                    remember_run(current_run)
                     st.rerun()
 
     with col2:
@@ -354,48 +589,68 @@ else:
                 with st.chat_message("user"):
                     st.markdown(prompt, unsafe_allow_html=True)
                 
-                with st.chat_message("assistant"):
-                    message_placeholder = st.empty()
-                    with st.spinner("در حال تحلیل سوال و یافتن پاسخ..."):
-                        generation_model = st.session_state.gemini_model
-                        
-                        intent_prompt = f"""Classify the user's query into 'retrieval' or 'aggregation'.
-                        - 'retrieval': Asks about specific content (e.g., "What did the coach say?").
-                        - 'aggregation': Asks for a list, summary, or count (e.g., "List all headlines", "How many news items?").
-                        Query: "{prompt}" -> Category:"""
-                        intent_response = generation_model.generate_content(intent_prompt)
-                        intent = intent_response.text.strip().lower()
-
-                        full_response = ""
-                        if "aggregation" in intent:
-                            message_placeholder.info("درخواست تجمیعی شناسایی شد... در حال پردازش تمام داده‌ها.")
-                            all_data = [f"عنوان: {item.get('title', 'بدون عنوان')}\nلینک: {item.get('link', 'بدون لینک')}" for item in st.session_state.scraped_data]
-                            context = "\n".join(all_data)
-                            total_count = len(all_data)
-                            final_prompt = f"""You are an assistant. Answer the user's question in Persian based ONLY on the provided list of data. Create a clear, structured, and categorized summary of the news.
-                            Data: Total articles: {total_count}\n{context}
-                            User's Question: {prompt}"""
-                        else: # retrieval
-                            message_placeholder.info("درخواست جستجوی اطلاعات خاص شناسایی شد...")
-                            context = find_relevant_context(prompt)
-                            if not context.strip() or "###" not in context:
-                                full_response = "متاسفانه نتوانستم اطلاعات مرتبطی در اخبار استخراج شده پیدا کنم."
+                with telemetry.run(f"چت: {prompt[:40]}") as current_run:
+                    with st.chat_message("assistant"):
+                        message_placeholder = st.empty()
+                        question_started = time.perf_counter()
+                        with st.spinner("در حال تحلیل سوال و یافتن پاسخ..."):
+                            generation_model = st.session_state.gemini_model
+                            current_version = data_version(st.session_state.scraped_data)
+                            # پاسخ سؤال‌های تکراری روی همان داده‌ها مستقیماً از کش برگردانده می‌شود
+                            full_response = response_cache.get(st.session_state.current_domain, current_version, prompt) or ""
+                            cached_answer = bool(full_response)
+                            final_prompt = None
+
+                            if cached_answer:
+                                message_placeholder.info("پاسخ این سؤال از قبل موجود است.")
                             else:
-                                final_prompt = f"""You are a helpful AI assistant. Answer the user's question in Persian based ONLY on the provided context.
-                                **CRITICAL: When you mention a news item, you MUST provide its source link, which is included in the context. Format the link as a clickable Markdown link, like this: [متن لینک](URL).**
-                                If the answer isn't in the context, say so clearly.
-
-                                Context:
-                                {context}
-                                
-                                Question: {prompt}
-                                """
-                        
-                        if not full_response: # اگر پاسخ از قبل مشخص نشده بود
-                            response = generation_model.generate_content(final_prompt)
-                            full_response = response.text
-
-                    message_placeholder.markdown(full_response, unsafe_allow_html=True)
+                                # اگر کلمات سؤال (مثلاً نام دقیق یک بازیکن یا تیم) در خبرها پیدا شوند، embedding سؤال لازم نیست؛
+                                # در غیر این صورت embedding هم‌زمان با تشخیص نوع سؤال شروع می‌شود تا در مسیر جستجو منتظر آن نمانیم
+                                lexical_only = st.session_state.vector_store.lexical.is_strong_match(prompt)
+                                query_embedding = None if lexical_only else start_query_embedding(prompt)
+                                # تشخیص نوع سؤال ابتدا با قواعد محلی و فقط در صورت تردید با مدل
+                                intent, _source = classify_intent(prompt, generation_model)
+                                if intent == AGGREGATION:
+                                    if query_embedding is not None: query_embedding.cancel()
+                                    message_placeholder.info("درخواست تجمیعی شناسایی شد... در حال پردازش تمام داده‌ها.")
+                                    # شمارش، گروه‌بندی و فهرست تیترها محلی محاسبه می‌شوند؛ خلاصه‌های بزرگ به صورت map-reduce
+                                    plan = plan_aggregation(prompt, st.session_state.scraped_data, generation_model)
+                                    if plan.answer:
+                                        full_response = plan.answer
+                                    else:
+                                        if plan.chunks:
+                                            message_placeholder.info(f"داده‌ها در {plan.chunks} بخش به صورت موازی خلاصه شدند "
+                                                                     f"({plan.cached_chunks} بخش از کش)؛ در حال ادغام...")
+                                        final_prompt = plan.prompt
+                                else: # retrieval
+                                    message_placeholder.info("درخواست جستجوی اطلاعات خاص شناسایی شد...")
+                                    query_vector = None
+                                    if query_embedding is not None:
+                                        try:
+                                            query_vector = query_embedding.result()
+                                        except Exception:
+                                            pass  # find_relevant_context دوباره تلاش کرده و خطا را نمایش می‌دهد
+                                    context = find_relevant_context(prompt, query_vector=query_vector, lexical_only=lexical_only)
+                                    if not context:
+                                        full_response = "متاسفانه نتوانستم اطلاعات مرتبطی در اخبار استخراج شده پیدا کنم."
+                                    else:
+                                        final_prompt = retrieval_prompt(prompt, context)
+
+                        if final_prompt: # نمایش جریانی پاسخ به محض تولید هر تکه
+                            first_token_at = None
+                            for text in stream_text(generation_model, final_prompt):
+                                if first_token_at is None: first_token_at = time.perf_counter()
+                                full_response += text
+                                message_placeholder.markdown(full_response + "▌", unsafe_allow_html=True)
+                            response_cache.put(st.session_state.current_domain, current_version, prompt, full_response)
+                            if first_token_at is not None:
+                                st.caption(f"⏱️ زمان تا اولین توکن: {first_token_at - question_started:.2f} ثانیه | "
+                                           f"زمان کل: {time.perf_counter() - question_started:.2f} ثانیه")
+
+                        message_placeholder.markdown(full_response, unsafe_allow_html=True)
+                remember_run(current_run)
                 st.session_state.messages.append({"role": "assistant", "content": full_response})
         else:
-            st.info("ابتدا اطلاعات یک سایت را استخراج و سپس برای پرسش و پاسخ آماده کنید تا این بخش فعال شود.")
\ No newline at end of file
+            st.info("ابتدا اطلاعات یک سایت را استخراج و سپس برای پرسش و پاسخ آماده کنید تا این بخش فعال شود.")
+
+render_telemetry_panel()
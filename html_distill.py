@@ -0,0 +1,114 @@
+# html_distill.py
+# خلاصه‌سازی HTML برای پرامپت‌های ساخت اسکرپر: حذف گره‌های غیرمحتوایی، فشرده کردن فاصله‌ها،
+# نگه داشتن فقط ویژگی‌های لازم برای سلکتور (class, id, href) و خلاصه کردن عناصر هم‌شکل تکراری.
+# به این ترتیب اسکلت کامل صفحه با کسری از توکن‌های `prettify()` به مدل می‌رسد.
+
+import copy
+
+from lxml import etree, html as lxml_html
+from cssselect import SelectorError
+
+DROP_TAGS = {'script', 'style', 'noscript', 'svg', 'iframe', 'template', 'link', 'meta', 'head', 'canvas',
+             'video', 'audio', 'source', 'picture', 'object', 'embed', 'track', 'map'}
+KEEP_ATTRIBUTES = ('id', 'class', 'href')
+KEEP_EMPTY_TAGS = {'a', 'img', 'br'}  # br همیشه خالی است؛ حذف آن متن دو طرفش را به هم می‌چسباند
+INLINE_TAGS = {'a', 'b', 'i', 'em', 'strong', 'span', 'small', 'time', 'abbr', 'cite', 'code', 'mark', 'sub', 'sup', 'u', 'img', 'br'}
+MAX_ATTRIBUTE_LENGTH = 120
+DEFAULT_MAX_CHARS = 60_000
+# مراحل فشرده‌سازی: (تعداد نمونه نگه داشته شده از هر نوع فرزند تکراری، حداکثر طول متن هر گره)
+_LEVELS = ((3, 120), (2, 80), (1, 40))
+
+
+def _collapse(text: str | None, limit: int, keep_space: bool = False) -> str | None:
+    """فاصله‌های پشت سر هم به یک فاصله تبدیل می‌شوند (نه حذف)، تا کلمات متن‌های درون‌خطی به هم نچسبند.
+    متن فقط-فاصله حذف می‌شود، مگر keep_space (دنباله عناصر درون‌خطی، مانند فاصله بین `</b> <i>`)."""
+    if not text: return None
+    if text.isspace(): return " " if keep_space else None
+    leading, trailing = text[0].isspace(), text[-1].isspace()
+    text = " ".join(text.split())
+    if len(text) > limit: text = text[:limit] + "…"
+    return (" " if leading else "") + text + (" " if trailing else "")
+
+
+def _signature(element) -> tuple:
+    return element.tag, element.get('class', '')
+
+
+def _clean(root, keep_similar: int, text_limit: int):
+    for node in list(root.iter(etree.Comment, etree.ProcessingInstruction)):
+        parent = node.getparent()
+        if parent is not None: parent.remove(node)
+    for element in list(root.iter(*DROP_TAGS)):
+        if element is not root and element.getparent() is not None: element.drop_tree()
+
+    for element in root.iter(etree.Element):
+        for name in list(element.attrib):
+            if name not in KEEP_ATTRIBUTES: del element.attrib[name]
+            elif len(element.attrib[name]) > MAX_ATTRIBUTE_LENGTH:
+                element.attrib[name] = element.attrib[name][:MAX_ATTRIBUTE_LENGTH]
+        element.text = _collapse(element.text, text_limit)
+        element.tail = _collapse(element.tail, text_limit, keep_space=element.tag in INLINE_TAGS)
+
+    # حذف گره‌های خالی از پایین به بالا
+    for element in reversed(list(root.iter(etree.Element))):
+        if element is root or element.tag in KEEP_EMPTY_TAGS: continue
+        if len(element) == 0 and not element.text and element.getparent() is not None:
+            element.drop_tree()
+
+    # خلاصه کردن فرزندان هم‌شکل: فقط چند نمونه اول از هر (tag, class) نگه داشته می‌شود
+    for parent in list(root.iter(etree.Element)):
+        children = [child for child in parent if isinstance(child.tag, str)]
+        if len(children) <= keep_similar: continue
+        groups = {}
+        for child in children: groups.setdefault(_signature(child), []).append(child)
+        for (tag, css_class), members in groups.items():
+            if len(members) <= keep_similar: continue
+            extras = members[keep_similar:]
+            marker = etree.Comment(f" +{len(extras)} more <{tag}{' class=' + repr(css_class) if css_class else ''}> ")
+            members[keep_similar - 1].addnext(marker)
+            for extra in extras: parent.remove(extra)
+
+
+def _serialize(element) -> str:
+    return lxml_html.tostring(element, encoding='unicode', with_tail=False)
+
+
+def distill_element(element, max_chars: int = DEFAULT_MAX_CHARS) -> str:
+    """نسخه خلاصه شده یک عنصر lxml؛ خود عنصر تغییر نمی‌کند."""
+    output = ""
+    for keep_similar, text_limit in _LEVELS:
+        working = copy.deepcopy(element)
+        _clean(working, keep_similar, text_limit)
+        output = _serialize(working)
+        if len(output) <= max_chars: return output
+    return output[:max_chars]
+
+
+def parse_html(html_content: str):
+    return lxml_html.document_fromstring(html_content)
+
+
+def distill_html(html_content: str, max_chars: int = DEFAULT_MAX_CHARS) -> str:
+    """خلاصه بدنه صفحه برای پرامپت مرحله ۱."""
+    if not html_content or not html_content.strip(): return ""
+    root = parse_html(html_content)
+    body = root.find('body')
+    return distill_element(body if body is not None else root, max_chars)
+
+
+def select_samples(root, selectors: list, limit: int = 5) -> list:
+    """انتخاب نمونه‌های ظرف خبر با سلکتورهای CSS روی همان درخت پارس شده (سلکتورهای نامعتبر نادیده گرفته می‌شوند)."""
+    found, seen = [], set()
+    for selector in selectors:
+        try:
+            matches = root.cssselect(selector)
+        except (SelectorError, etree.XPathError):
+            continue
+        for element in matches:
+            if id(element) in seen: continue
+            seen.add(id(element))
+            found.append(element)
+    # ترتیب سند حفظ می‌شود، مانند `soup.select` با چند سلکتور
+    order = {id(element): position for position, element in enumerate(root.iter())}
+    found.sort(key=lambda element: order.get(id(element), 0))
+    return found[:limit]
@@ -0,0 +1,128 @@
+# incremental.py
+# وضعیت لازم برای پردازش افزایشی: ETag/Last-Modified هر آدرس (درخواست شرطی) و فهرست خبرهای دیده شده هر دامنه.
+# در صورت پاسخ 304 کل مسیر پردازش کوتاه می‌شود و در غیر این صورت فقط خبرهای جدید یا تغییر یافته ادامه می‌یابند.
+# خبرهای آخرین اجرای هر آدرس جداگانه ثبت می‌شوند تا 304 یک صفحه، خبرهای صفحه دیگری از همان دامنه را برنگرداند.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+INCREMENTAL_DB_FILE = os.path.join('.cache', 'incremental.sqlite3')
+_TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref', 'ocid')
+
+
+def normalize_link(link: str) -> str:
+    """حذف fragment، پارامترهای ردیابی و اسلش انتهایی تا نسخه‌های مختلف یک لینک یکی شوند."""
+    parts = urlsplit(link.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith(_TRACKING_PARAMS)]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(sorted(query)), ''))
+
+
+def article_hash(item: dict) -> str:
+    text = " ".join(f"{item.get('title') or ''}\n{item.get('description') or ''}".split())
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def dedupe_articles(articles: list) -> list:
+    """حذف خبرهای تکراری یک صفحه بر اساس لینک نرمال شده (اولین نمونه نگه داشته می‌شود)."""
+    seen, unique = set(), []
+    for item in articles or []:
+        if not isinstance(item, dict) or not item.get('link'): continue
+        key = normalize_link(item['link'])
+        if key in seen: continue
+        seen.add(key)
+        unique.append(item)
+    return unique
+
+
+class IncrementalStore:
+    def __init__(self, path: str = INCREMENTAL_DB_FILE):
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS http_validators (
+                url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, scraper_hash TEXT, fetched_at REAL);
+            CREATE TABLE IF NOT EXISTS articles (
+                domain TEXT NOT NULL, link_key TEXT NOT NULL, content_hash TEXT NOT NULL, item TEXT NOT NULL,
+                first_seen REAL NOT NULL, last_seen REAL NOT NULL, PRIMARY KEY (domain, link_key));
+            CREATE TABLE IF NOT EXISTS page_articles (
+                url TEXT PRIMARY KEY, domain TEXT NOT NULL, link_keys TEXT NOT NULL, recorded_at REAL NOT NULL);
+        """)
+        self._conn.commit()
+
+    # --- درخواست‌های شرطی ---
+    def conditional_headers(self, url: str, scraper_hash: str | None = None) -> dict:
+        """هدرهای If-None-Match/If-Modified-Since؛ اگر اسکرپر تغییر کرده باشد، درخواست بدون شرط ارسال می‌شود."""
+        # بدون فهرست خبرهای ثبت شده همین آدرس، پاسخ 304 قابل استفاده نیست
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, scraper_hash FROM http_validators JOIN page_articles USING (url) WHERE url = ?",
+                (url,)).fetchone()
+        if not row or (scraper_hash is not None and row[2] != scraper_hash): return {}
+        headers = {}
+        if row[0]: headers['If-None-Match'] = row[0]
+        if row[1]: headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def save_validators(self, url: str, etag: str | None, last_modified: str | None, scraper_hash: str | None = None):
+        """باید فقط پس از پردازش موفق صفحه فراخوانی شود؛ وگرنه 304 بعدی داده‌ای برای بازگرداندن نخواهد داشت."""
+        if not etag and not last_modified: return
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO http_validators VALUES (?, ?, ?, ?, ?)",
+                               (url, etag, last_modified, scraper_hash, time.time()))
+            self._conn.commit()
+
+    # --- حذف تکرار خبرها بین اجراها ---
+    def record_articles(self, domain: str, articles: list, url: str | None = None) -> list:
+        """ثبت خبرهای صفحه (و در صورت وجود url، فهرست خبرهای همان صفحه) و برگرداندن فقط خبرهای جدید یا دارای محتوای تغییر یافته."""
+        now = time.time()
+        articles = dedupe_articles(articles)
+        keyed = [(normalize_link(item['link']), article_hash(item), item) for item in articles]
+        with self._lock:
+            known = dict(self._conn.execute("SELECT link_key, content_hash FROM articles WHERE domain = ?", (domain,)).fetchall())
+            delta = [item for key, digest, item in keyed if known.get(key) != digest]
+            self._conn.executemany(
+                """INSERT INTO articles (domain, link_key, content_hash, item, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(domain, link_key) DO UPDATE SET content_hash = excluded.content_hash,
+                   item = excluded.item, last_seen = excluded.last_seen""",
+                [(domain, key, digest, json.dumps(item, ensure_ascii=False), now, now) for key, digest, item in keyed])
+            if url is not None:
+                self._conn.execute("INSERT OR REPLACE INTO page_articles VALUES (?, ?, ?, ?)",
+                                   (url, domain, json.dumps([key for key, _, _ in keyed]), now))
+            self._conn.commit()
+        return delta
+
+    def latest_articles(self, domain: str, url: str | None = None) -> list:
+        """خبرهای آخرین اجرای موفق آدرس url (برای بازگرداندن نتایج در پاسخ 304)؛ بدون url، آخرین اجرای دامنه."""
+        with self._lock:
+            if url is not None:
+                rows = self._conn.execute(
+                    "SELECT a.item FROM page_articles AS p, json_each(p.link_keys) AS k"
+                    " JOIN articles AS a ON a.domain = p.domain AND a.link_key = k.value"
+                    " WHERE p.url = ? AND p.domain = ? ORDER BY k.key", (url, domain)).fetchall()
+                return [json.loads(row[0]) for row in rows]
+            rows = self._conn.execute(
+                "SELECT item FROM articles WHERE domain = ? AND last_seen = (SELECT MAX(last_seen) FROM articles WHERE domain = ?)"
+                " ORDER BY first_seen", (domain, domain)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store() -> IncrementalStore:
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                _default_store = IncrementalStore()
+    return _default_store
@@ -0,0 +1,197 @@
+# jobs.py
+# صف کارهای دریافت و استخراج در SQLite (حالت WAL) که بین رابط کاربری و چند پردازه کارگر (worker.py) مشترک است.
+# هر کار با اجاره زمان‌دار برداشته می‌شود؛ اگر کارگری از کار بیفتد، پس از پایان اجاره کار دوباره در دسترس قرار می‌گیرد.
+# برنامه زمان‌بندی دوره‌ای هر آدرس نیز در همین پایگاه داده نگهداری می‌شود.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+JOBS_DB_FILE = os.path.join('.cache', 'jobs.sqlite3')
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+FETCH_SIMPLE, FETCH_SELENIUM = 'simple', 'selenium'
+DEFAULT_LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+
+@dataclass
+class Job:
+    id: int
+    url: str
+    domain: str
+    fetch_method: str
+    status: str
+    attempts: int
+    created_at: float
+    started_at: float | None
+    finished_at: float | None
+    worker: str | None
+    result: dict | None
+    error: str | None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+
+_JOB_COLUMNS = "id, url, domain, fetch_method, status, attempts, created_at, started_at, finished_at, worker, result, error"
+
+
+def _job(row) -> Job:
+    values = list(row)
+    values[10] = json.loads(values[10]) if values[10] else None
+    return Job(*values)
+
+
+class JobQueue:
+    def __init__(self, path: str = JOBS_DB_FILE):
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, domain TEXT NOT NULL, fetch_method TEXT NOT NULL,
+                status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, started_at REAL,
+                finished_at REAL, lease_until REAL, worker TEXT, result TEXT, error TEXT);
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url, status);
+            CREATE TABLE IF NOT EXISTS schedules (
+                url TEXT PRIMARY KEY, domain TEXT NOT NULL, fetch_method TEXT NOT NULL, interval_seconds REAL NOT NULL,
+                next_run_at REAL NOT NULL, last_job_id INTEGER);
+        """)
+
+    def _transaction(self, func):
+        """اجرای func در یک تراکنش BEGIN IMMEDIATE (قفل نوشتن بین پردازه‌ها)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- ثبت و برداشت کار ---
+    def enqueue(self, url: str, fetch_method: str = FETCH_SIMPLE) -> int:
+        """ثبت کار جدید؛ اگر برای همین آدرس کاری در صف یا در حال اجرا باشد، شماره همان کار برگردانده می‌شود."""
+        def insert(conn):
+            row = conn.execute("SELECT id FROM jobs WHERE url = ? AND status IN (?, ?) ORDER BY id LIMIT 1",
+                               (url, QUEUED, RUNNING)).fetchone()
+            if row: return row[0]
+            return conn.execute("INSERT INTO jobs (url, domain, fetch_method, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                                (url, urlparse(url).netloc, fetch_method, QUEUED, time.time())).lastrowid
+        return self._transaction(insert)
+
+    def claim(self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+              fetch_methods: tuple = (FETCH_SIMPLE, FETCH_SELENIUM)) -> Job | None:
+        """برداشتن قدیمی‌ترین کار آماده با یکی از روش‌های دریافت fetch_methods؛ کارهای دامنه‌ای که کار دیگری از آن
+        در حال اجراست کنار گذاشته می‌شوند تا شاخص برداری یک دامنه هم‌زمان توسط دو کارگر نوشته نشود."""
+        def take(conn):
+            now = time.time()
+            # کارهایی که اجاره‌شان تمام شده (کارگر از کار افتاده) به صف برمی‌گردند یا پس از چند تلاش شکست می‌خورند
+            conn.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = 'lease expired' "
+                         "WHERE status = ? AND lease_until < ?", (MAX_ATTEMPTS, FAILED, QUEUED, RUNNING, now))
+            row = conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = ? AND fetch_method IN ({', '.join('?' * len(fetch_methods))}) "
+                "AND domain NOT IN (SELECT domain FROM jobs WHERE status = ?) ORDER BY created_at LIMIT 1",
+                (QUEUED, *fetch_methods, RUNNING)).fetchone()
+            if row is None: return None
+            conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ?, worker = ? "
+                         "WHERE id = ?", (RUNNING, now, now + lease_seconds, worker, row[0]))
+            job = _job(row)
+            job.status, job.attempts, job.started_at, job.worker = RUNNING, job.attempts + 1, now, worker
+            return job
+        return self._transaction(take)
+
+    def complete(self, job_id: int, result: dict):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = NULL WHERE id = ?",
+                               (DONE, time.time(), json.dumps(result, ensure_ascii=False), job_id))
+
+    def fail(self, job_id: int, error: str, retry: bool = True):
+        """ثبت خطا؛ در صورت retry و باقی بودن تلاش، کار دوباره به صف برمی‌گردد."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < ? THEN ? ELSE ? END, finished_at = ?, error = ? WHERE id = ?",
+                (retry, MAX_ATTEMPTS, QUEUED, FAILED, time.time(), error, job_id))
+
+    # --- وضعیت ---
+    def get(self, job_id: int) -> Job | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def recent(self, limit: int = 20, domain: str | None = None) -> list:
+        query = f"SELECT {_JOB_COLUMNS} FROM jobs" + (" WHERE domain = ?" if domain else "") + " ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, ((domain, limit) if domain else (limit,))).fetchall()
+        return [_job(row) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def last_success(self, domain: str, url: str | None = None) -> float | None:
+        """زمان آخرین کار موفق دامنه (یا فقط آدرس url)."""
+        with self._lock:
+            if url is not None:
+                row = self._conn.execute("SELECT MAX(finished_at) FROM jobs WHERE url = ? AND status = ?", (url, DONE)).fetchone()
+            else:
+                row = self._conn.execute("SELECT MAX(finished_at) FROM jobs WHERE domain = ? AND status = ?", (domain, DONE)).fetchone()
+        return row[0]
+
+    # --- زمان‌بندی دوره‌ای ---
+    def schedule(self, url: str, interval_seconds: float, fetch_method: str = FETCH_SIMPLE):
+        """اولین اجرا بلافاصله انجام می‌شود و پس از آن هر interval_seconds یک بار."""
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO schedules (url, domain, fetch_method, interval_seconds, next_run_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(url) DO UPDATE SET fetch_method = excluded.fetch_method,
+                   interval_seconds = excluded.interval_seconds, next_run_at = excluded.next_run_at""",
+                (url, urlparse(url).netloc, fetch_method, interval_seconds, time.time()))
+
+    def unschedule(self, url: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM schedules WHERE url = ?", (url,))
+
+    def schedules(self) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT url, fetch_method, interval_seconds, next_run_at, last_job_id FROM schedules "
+                                      "ORDER BY next_run_at").fetchall()
+        return [dict(zip(("url", "fetch_method", "interval_seconds", "next_run_at", "last_job_id"), row)) for row in rows]
+
+    def enqueue_due(self) -> list:
+        """ثبت کار برای برنامه‌هایی که زمانشان رسیده است؛ چند کارگر می‌توانند هم‌زمان آن را صدا بزنند."""
+        def due(conn):
+            now = time.time()
+            rows = conn.execute("SELECT url, fetch_method, interval_seconds FROM schedules WHERE next_run_at <= ?", (now,)).fetchall()
+            job_ids = []
+            for url, fetch_method, interval in rows:
+                existing = conn.execute("SELECT id FROM jobs WHERE url = ? AND status IN (?, ?) LIMIT 1",
+                                        (url, QUEUED, RUNNING)).fetchone()
+                job_id = existing[0] if existing else conn.execute(
+                    "INSERT INTO jobs (url, domain, fetch_method, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (url, urlparse(url).netloc, fetch_method, QUEUED, now)).lastrowid
+                conn.execute("UPDATE schedules SET next_run_at = ?, last_job_id = ? WHERE url = ?", (now + interval, job_id, url))
+                job_ids.append(job_id)
+            return job_ids
+        return self._transaction(due)
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    global _default_queue
+    if _default_queue is None:
+        with _default_lock:
+            if _default_queue is None:
+                _default_queue = JobQueue()
+    return _default_queue
@@ -0,0 +1,157 @@
+# lexical_index.py
+# شاخص واژگانی (BM25) روی همان متن‌های شاخص برداری: نمایه معکوس کلمه -> (شماره سندها، تعداد تکرارها).
+# متن‌ها و سؤال با text_normalize یکسان‌سازی می‌شوند. نتایج با رتبه‌های جستجوی برداری به روش RRF ترکیب می‌شوند و
+# اگر تطابق واژگانی قوی باشد (مثلاً نام دقیق یک بازیکن، تیم یا شخص)، embedding سؤال لازم نیست.
+# نمایه به صورت پیشرو (کلمه‌های هر سند) کنار بردارها ذخیره می‌شود تا سندهای جدید فقط به انتهای فایل‌ها اضافه شوند؛
+# هنگام بارگذاری، نمایه معکوس با numpy از همین آرایه‌ها ساخته می‌شود و متن‌ها دوباره توکن نمی‌شوند.
+
+import math
+from bisect import bisect_left
+from collections import Counter
+
+import numpy as np
+
+from text_normalize import tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+STRONG_MATCH_COVERAGE = 0.75  # حداقل سهم وزن کلمات سؤال که باید در بهترین سند وجود داشته باشند
+# کلمات پرتکرار سؤال که در تطابق واژگانی نادیده گرفته می‌شوند
+_STOPWORDS = frozenset((
+    'و', 'در', 'به', 'از', 'که', 'را', 'با', 'این', 'ان', 'برای', 'تا', 'یا', 'هم', 'چه', 'چی', 'چرا', 'کی', 'کجا',
+    'کدام', 'است', 'بود', 'شد', 'شده', 'می', 'ها', 'های', 'درباره', 'مورد', 'گفت', 'گفته', 'خبر', 'خبرهای', 'اخبار',
+    'el', 'la', 'los', 'las', 'de', 'del', 'en', 'y', 'a', 'un', 'una', 'que', 'por', 'para', 'con', 'se', 'al', 'lo',
+    'the', 'of', 'and', 'in', 'to', 'an', 'on', 'for', 'is', 'what', 'who', 'about', 'did', 'say', 'news',
+))
+
+
+def query_terms(query: str) -> list:
+    return list(dict.fromkeys(term for term in tokenize(query) if term not in _STOPWORDS))
+
+
+class LexicalIndex:
+    def __init__(self):
+        self._postings = {}  # کلمه -> ([شماره سندها به ترتیب صعودی], [تعداد تکرار در هر سند])
+        self._lengths = []
+        self._length_array = None
+        self._deleted = set()  # سندهای جایگزین شده که تا compact در نتایج نمی‌آیند
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def remove(self, doc_ids):
+        self._deleted.update(doc_ids)
+
+    def compact(self, live: np.ndarray):
+        """حذف سندهای live=False و شماره‌گذاری دوباره بقیه (هم‌گام با VectorIndex.compact)."""
+        new_ids = np.cumsum(live) - 1
+        for term in list(self._postings):
+            doc_ids, counts = self._postings[term]
+            kept = [(int(new_ids[doc_id]), count) for doc_id, count in zip(doc_ids, counts) if live[doc_id]]
+            if kept: self._postings[term] = ([doc_id for doc_id, _ in kept], [count for _, count in kept])
+            else: del self._postings[term]
+        self._lengths = [length for length, keep in zip(self._lengths, live) if keep]
+        self._length_array, self._deleted = None, set()
+
+    def add(self, contents: list):
+        for text in contents:
+            doc_id = len(self._lengths)
+            terms = Counter(tokenize(text))
+            for term, count in terms.items():
+                doc_ids, counts = self._postings.get(term, ([], []))
+                if not isinstance(doc_ids, list):
+                    # فهرست بارگذاری شده از دیسک (برش فقط-خواندنی آرایه) فقط هنگام اولین تغییر به list تبدیل می‌شود
+                    doc_ids, counts = doc_ids.tolist(), counts.tolist()
+                self._postings[term] = (doc_ids, counts)
+                doc_ids.append(doc_id)
+                counts.append(count)
+            self._lengths.append(sum(terms.values()))
+        self._length_array = None
+
+    def doc_arrays(self, start: int = 0) -> tuple[list, np.ndarray, np.ndarray, np.ndarray]:
+        """نمایه پیشرو سندهای start به بعد برای ذخیره افزایشی: (همه کلمات به ترتیب شماره، شماره کلمه و تعداد تکرار
+        هر جفت به ترتیب سند، تعداد کلمات متمایز هر سند). شماره هر کلمه جایگاه آن در _postings است."""
+        term_parts, doc_parts, count_parts = [], [], []
+        for term_id, (doc_ids, counts) in enumerate(self._postings.values()):
+            if not len(doc_ids) or doc_ids[-1] < start: continue
+            position = bisect_left(doc_ids, start) if start else 0
+            doc_parts.append(np.asarray(doc_ids[position:], dtype=np.int32))
+            count_parts.append(np.asarray(counts[position:], dtype=np.int32))
+            term_parts.append(np.full(len(doc_parts[-1]), term_id, dtype=np.int32))
+        empty = np.empty(0, dtype=np.int32)
+        doc_ids = np.concatenate(doc_parts) if doc_parts else empty
+        order = np.argsort(doc_ids, kind='stable')
+        sizes = np.bincount(doc_ids - start, minlength=len(self._lengths) - start).astype(np.int32)
+        return (list(self._postings), (np.concatenate(term_parts) if term_parts else empty)[order],
+                (np.concatenate(count_parts) if count_parts else empty)[order], sizes)
+
+    @classmethod
+    def from_doc_arrays(cls, terms: list, term_ids: np.ndarray, counts: np.ndarray, sizes: np.ndarray) -> "LexicalIndex":
+        """ساخت نمایه معکوس از خروجی doc_arrays با چند عمل برداری numpy (بدون توکن کردن دوباره متن‌ها)."""
+        doc_ids = np.repeat(np.arange(len(sizes), dtype=np.int32), sizes)
+        counts = np.asarray(counts)
+        lengths = np.bincount(doc_ids, weights=counts, minlength=len(sizes)).astype(np.int64)
+        order = np.argsort(term_ids, kind='stable')  # ترتیب صعودی سندها در هر کلمه حفظ می‌شود
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(terms)))]).tolist()
+        doc_ids, counts = doc_ids[order], counts[order]
+        index = cls()
+        index._postings = {term: (doc_ids[begin:end], counts[begin:end])
+                           for term, begin, end in zip(terms, offsets, offsets[1:])}
+        index._lengths = lengths.tolist()
+        return index
+
+    def idf(self, term: str) -> float:
+        frequency = len(self._postings[term][0]) if term in self._postings else 0
+        return math.log(1 + (len(self) - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, terms: list) -> np.ndarray:
+        """امتیاز BM25 همه سندها؛ فقط فهرست سندهای کلمات سؤال پیمایش می‌شود."""
+        if self._length_array is None: self._length_array = np.asarray(self._lengths, dtype=np.float32)
+        lengths = self._length_array
+        scores = np.zeros(len(lengths), dtype=np.float32)
+        if not len(lengths): return scores
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(float(lengths.mean()), 1.0))
+        for term in terms:
+            if term not in self._postings: continue
+            doc_ids, counts = self._postings[term]
+            doc_ids, counts = np.asarray(doc_ids), np.asarray(counts, dtype=np.float32)
+            scores[doc_ids] += self.idf(term) * counts * (BM25_K1 + 1) / (counts + length_norm[doc_ids])
+        if self._deleted: scores[list(self._deleted)] = 0
+        return scores
+
+    def search(self, query: str, top_k: int = 7) -> list:
+        """خروجی: فهرست (شماره سند، امتیاز BM25) به ترتیب نزولی؛ فقط سندهایی که حداقل یک کلمه سؤال را دارند."""
+        terms = query_terms(query)
+        if not terms or not len(self): return []
+        scores = self.scores(terms)
+        matched = np.flatnonzero(scores > 0)
+        order = matched[np.argsort(-scores[matched], kind='stable')[:top_k]]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def coverage(self, query: str, doc_id: int) -> float:
+        """سهم وزن (idf) کلمات سؤال که در سند وجود دارند؛ کلمات ناموجود در کل شاخص بیشترین وزن را دارند."""
+        terms = query_terms(query)
+        if not terms: return 0.0
+        total = matched = 0.0
+        for term in terms:
+            weight = self.idf(term)
+            total += weight
+            doc_ids = self._postings.get(term, ((),))[0]
+            position = bisect_left(doc_ids, doc_id)
+            if position < len(doc_ids) and doc_ids[position] == doc_id: matched += weight
+        return matched / total if total else 0.0
+
+    def is_strong_match(self, query: str) -> bool:
+        """آیا بهترین سند واژگانی تقریباً همه کلمات مهم سؤال را دارد (پاسخ بدون embedding سؤال)؟"""
+        best = self.search(query, top_k=1)
+        return bool(best) and self.coverage(query, best[0][0]) >= STRONG_MATCH_COVERAGE
+
+
+def reciprocal_rank_fusion(rankings: list, top_k: int = 7, k: int = RRF_K) -> list:
+    """ترکیب چند فهرست رتبه‌بندی (شماره سند، امتیاز) بر اساس رتبه؛ به مقیاس امتیازهای هر روش وابسته نیست."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _score) in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
@@ -0,0 +1,200 @@
+# scraper_runtime.py
+# اجرای ایزوله اسکرپرهای تولید شده در یک استخر پردازه، با محدودیت زمان و حافظه برای هر فراخوانی.
+# هر پردازه کارگر، توابع کامپایل شده را بر اساس هش کد نگه می‌دارد تا کد تکراری دوباره exec نشود.
+# هر کارگر شروع هر کار را (با pid خود) گزارش می‌دهد؛ اگر کاری گیر کند فقط همان پردازه کشته می‌شود و
+# کارهای هم‌زمان دیگر (جلسات دیگر یا اجرای دسته‌ای) ادامه پیدا می‌کنند.
+
+import atexit
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Iterable
+
+import telemetry
+from scraper_store import code_hash, compile_scraper
+from selector_engine import extract_with_spec, is_spec
+
+try:
+    import resource
+except ImportError:  # ویندوز
+    resource = None
+
+DEFAULT_TIMEOUT = 20  # ثانیه
+DEFAULT_MEMORY_LIMIT_MB = 1024
+TIMEOUT_GRACE = 5  # اگر پردازه به سیگنال پاسخ ندهد، پس از این مدت همان پردازه کشته می‌شود
+MAX_TASKS_PER_CHILD = 200
+_POLL_SECONDS = 0.5
+
+_pool = None
+_pool_generation = 0
+_pool_lock = threading.Lock()
+_started_queue = None       # کارگر -> پردازه اصلی: (شماره کار، pid، زمان شروع)
+_task_starts = {}           # شماره کار -> (pid، زمان شروع)
+_task_starts_lock = threading.Lock()
+_task_ids = itertools.count()
+
+
+class ScraperError(Exception):
+    """خطا در اجرای کد اسکرپر (شامل نبود تابع `scrape_news`)."""
+
+
+class ScraperTimeout(ScraperError):
+    """اجرای اسکرپر از زمان مجاز بیشتر طول کشید."""
+
+
+# --- کد سمت پردازه کارگر ---
+_worker_functions = {}
+
+
+def _init_worker(memory_limit_mb: int | None, started_queue):
+    global _started_queue
+    _started_queue = started_queue
+    if resource is not None and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+
+
+def _raise_timeout(signum, frame):
+    raise ScraperTimeout("زمان اجرای اسکرپر به پایان رسید.")
+
+
+def _worker_run(task_id: int, digest: str, scraper_code: str, html_content: str, timeout: float) -> list:
+    _started_queue.put((task_id, os.getpid(), time.time()))
+    use_alarm = hasattr(signal, 'setitimer')
+    try:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        scraper_function = _worker_functions.get(digest)
+        if scraper_function is None:
+            try:
+                scraper_function = _worker_functions[digest] = compile_scraper(scraper_code)
+            except ValueError as e:
+                raise ScraperError(str(e))
+        return scraper_function(html_content)
+    except ScraperError:
+        raise
+    except MemoryError:
+        raise ScraperError("اسکرپر از حد مجاز حافظه فراتر رفت.")
+    except Exception as e:
+        # استثناهای دلخواه کد کاربر ممکن است قابل pickle نباشند
+        raise ScraperError(f"{type(e).__name__}: {e}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# --- کد سمت پردازه اصلی ---
+def get_pool(processes: int | None = None, memory_limit_mb: int | None = DEFAULT_MEMORY_LIMIT_MB):
+    """استخر پردازه مشترک؛ از روش spawn استفاده می‌شود تا کارگرها حافظه برنامه اصلی را به ارث نبرند."""
+    global _pool, _started_queue
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                context = multiprocessing.get_context('spawn')
+                # SimpleQueue هم‌زمان (بدون نخ feeder) می‌نویسد؛ اسکرپری که GIL را رها نکند گزارش را متوقف نمی‌کند
+                _started_queue = context.SimpleQueue()
+                _pool = context.Pool(processes=processes or os.cpu_count() or 2, initializer=_init_worker,
+                                     initargs=(memory_limit_mb, _started_queue), maxtasksperchild=MAX_TASKS_PER_CHILD)
+    return _pool
+
+
+def shutdown():
+    global _pool, _pool_generation
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+            _pool_generation += 1
+
+
+atexit.register(shutdown)
+
+
+def _drain_started():
+    """خواندن گزارش‌های شروع رسیده از کارگرها؛ باید با _task_starts_lock فراخوانی شود."""
+    while not _started_queue.empty():
+        started_id, pid, started_at = _started_queue.get()
+        _task_starts[started_id] = (pid, started_at)
+
+
+def _task_start(task_id: int) -> tuple | None:
+    """(pid، زمان شروع) کار، پس از خواندن گزارش‌های رسیده از کارگرها."""
+    with _task_starts_lock:
+        _drain_started()
+        return _task_starts.get(task_id)
+
+
+def _kill_worker(pid: int):
+    """کشتن فقط پردازه گیر کرده؛ استخر به جای آن پردازه جدیدی می‌سازد و کارهای دیگر ادامه می‌یابند."""
+    try:
+        os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+    except OSError:
+        pass
+
+
+def _collect(task: tuple, timeout: float) -> list:
+    """انتظار برای نتیجه؛ مهلت از زمان شروع واقعی کار حساب می‌شود (نه از زمان انتظار در صف استخر)."""
+    task_id, generation, async_result = task
+    try:
+        while True:
+            started = _task_start(task_id)
+            deadline = started[1] + timeout + TIMEOUT_GRACE if started else None
+            wait = _POLL_SECONDS if deadline is None else max(deadline - time.time(), 0.01)
+            try:
+                return async_result.get(wait)
+            except multiprocessing.TimeoutError:
+                if generation != _pool_generation:
+                    raise ScraperError("استخر اجرای اسکرپر متوقف شد.")
+                if deadline is not None and time.time() >= deadline and not async_result.ready():
+                    # کارگر گیر کرده و به سیگنال پاسخ نداده است
+                    _kill_worker(started[0])
+                    raise ScraperTimeout("زمان اجرای اسکرپر به پایان رسید و پردازه آن متوقف شد.")
+    finally:
+        # کارگر گزارش شروع را پیش از نتیجه می‌نویسد؛ اگر هنوز خوانده نشده باشد، خواندن بعدی آن را دوباره
+        # به _task_starts اضافه می‌کرد و هرگز حذف نمی‌شد
+        with _task_starts_lock:
+            _drain_started()
+            _task_starts.pop(task_id, None)
+
+
+def _submit(html_content: str, scraper_code: str, timeout: float) -> tuple:
+    task_id = next(_task_ids)
+    pool = get_pool()
+    return task_id, _pool_generation, pool.apply_async(
+        _worker_run, (task_id, code_hash(scraper_code), scraper_code, html_content, timeout))
+
+
+def run_scraper(html_content: str, scraper_code: str, timeout: float = DEFAULT_TIMEOUT) -> list:
+    """اجرای اسکرپر روی یک صفحه در استخر ایزوله."""
+    return _collect(_submit(html_content, scraper_code, timeout), timeout)
+
+
+def run_many(jobs: Iterable[tuple], timeout: float = DEFAULT_TIMEOUT) -> list:
+    """اجرای موازی چند (html, code) روی همه هسته‌ها. برای هر کار، نتیجه یا استثنای مربوط برگردانده می‌شود."""
+    pending = [_submit(html, code, timeout) for html, code in jobs]
+    results = []
+    for task in pending:
+        try:
+            results.append(_collect(task, timeout))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def run_saved_scraper(html_content: str, scraper, domain: str | None = None, timeout: float = DEFAULT_TIMEOUT) -> list:
+    """اجرای اسکرپر ذخیره شده: مشخصات سلکتور مستقیماً با موتور lxml و کد پایتون در استخر ایزوله."""
+    with telemetry.span('scrape', domain=domain, kind='spec' if is_spec(scraper) else 'code') as span:
+        if is_spec(scraper):
+            articles = extract_with_spec(html_content, scraper)
+        else:
+            articles = run_scraper(html_content, scraper, timeout=timeout)
+        span.add(items=len(articles or []))
+        return articles
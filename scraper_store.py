@@ -0,0 +1,213 @@
+# scraper_store.py
+# نگهداری و اجرای اسکرپرهای ذخیره شده؛ مستقل از Streamlit تا از خط فرمان هم قابل استفاده باشد.
+# اسکرپرها در یک پایگاه SQLite (حالت WAL) با ذخیره اتمی هر دامنه، تاریخچه نسخه‌ها و آمار اجرا نگهداری می‌شوند.
+# فایل قدیمی scrapers.json در اولین اجرا به صورت خودکار وارد می‌شود.
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SCRAPER_FILE = 'scrapers.json'
+SCRAPER_DB_FILE = 'scrapers.sqlite3'
+
+# الگوهای رایج در کدهای تولید شده برای یافتن سلکتور اصلی خبرها
+_ARTICLE_SELECTOR_PATTERNS = (
+    re.compile(r"""\b(?:best_)?article_selectors?\s*=\s*(["'])(.+?)\1"""),
+    re.compile(r"""\.select\(\s*(["'])(.+?)\1"""),
+)
+
+
+class ScraperRegistry:
+    """ثبت اسکرپرها با تراکنش؛ خواندن‌ها از کش داخل پردازه انجام می‌شود که با تغییر نسخه پایگاه داده باطل می‌شود."""
+
+    def __init__(self, path: str = SCRAPER_DB_FILE, import_from: str | None = SCRAPER_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS scrapers (
+                domain TEXT PRIMARY KEY, version INTEGER NOT NULL, kind TEXT NOT NULL, body TEXT NOT NULL,
+                created_at REAL NOT NULL, generation_seconds REAL, last_success REAL, last_failure REAL,
+                run_count INTEGER NOT NULL DEFAULT 0, failure_count INTEGER NOT NULL DEFAULT 0,
+                last_item_count INTEGER, total_items INTEGER NOT NULL DEFAULT 0, avg_extract_seconds REAL);
+            CREATE TABLE IF NOT EXISTS scraper_versions (
+                domain TEXT NOT NULL, version INTEGER NOT NULL, kind TEXT NOT NULL, body TEXT NOT NULL,
+                created_at REAL NOT NULL, generation_seconds REAL, note TEXT, PRIMARY KEY (domain, version));
+        """)
+        self._cache, self._cache_version = None, None
+        if import_from: self.import_json(import_from)
+
+    @staticmethod
+    def _encode(scraper: str | dict) -> tuple[str, str]:
+        if isinstance(scraper, dict): return 'spec', json.dumps(scraper, ensure_ascii=False)
+        return 'code', scraper
+
+    @staticmethod
+    def _decode(kind: str, body: str) -> str | dict:
+        return json.loads(body) if kind == 'spec' else body
+
+    def _data_version(self) -> int:
+        # مقدار data_version فقط با commit اتصال‌های دیگر (جلسات یا پردازه‌های دیگر) تغییر می‌کند
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            version = self._data_version()
+            if self._cache is None or version != self._cache_version:
+                rows = self._conn.execute("SELECT domain, kind, body FROM scrapers").fetchall()
+                self._cache = {domain: self._decode(kind, body) for domain, kind, body in rows}
+                self._cache_version = version
+            return self._cache
+
+    def all(self) -> dict:
+        return dict(self._snapshot())
+
+    def get(self, domain: str) -> str | dict | None:
+        return self._snapshot().get(domain)
+
+    def save(self, domain: str, scraper: str | dict, generation_seconds: float | None = None, note: str | None = None) -> int:
+        """ذخیره اتمی نسخه جدید اسکرپر دامنه؛ شماره نسخه برگردانده می‌شود."""
+        kind, body = self._encode(scraper)
+        now = time.time()
+        with self._lock:
+            # اگر خود BEGIN شکست بخورد (مثلاً database is locked) تراکنشی برای ROLLBACK وجود ندارد و خطای اصلی باید دیده شود
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM scraper_versions WHERE domain = ?",
+                                             (domain,)).fetchone()[0]
+                self._conn.execute("INSERT INTO scraper_versions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (domain, version, kind, body, now, generation_seconds, note))
+                # آمار اجرا مربوط به نسخه فعلی است؛ با نسخه جدید (یا بازگشت) از صفر شروع می‌شود
+                self._conn.execute(
+                    """INSERT INTO scrapers (domain, version, kind, body, created_at, generation_seconds) VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(domain) DO UPDATE SET version = excluded.version, kind = excluded.kind, body = excluded.body,
+                       created_at = excluded.created_at, generation_seconds = excluded.generation_seconds,
+                       last_success = NULL, last_failure = NULL, run_count = 0, failure_count = 0,
+                       last_item_count = NULL, total_items = 0, avg_extract_seconds = NULL""",
+                    (domain, version, kind, body, now, generation_seconds))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache = None
+        return version
+
+    def history(self, domain: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, kind, created_at, generation_seconds, note FROM scraper_versions WHERE domain = ? ORDER BY version DESC",
+                (domain,)).fetchall()
+        return [dict(zip(("version", "kind", "created_at", "generation_seconds", "note"), row)) for row in rows]
+
+    def rollback(self, domain: str, version: int) -> int:
+        """بازگشت به یک نسخه قبلی؛ به صورت یک نسخه جدید ثبت می‌شود تا تاریخچه خطی بماند."""
+        with self._lock:
+            row = self._conn.execute("SELECT kind, body FROM scraper_versions WHERE domain = ? AND version = ?",
+                                     (domain, version)).fetchone()
+        if row is None: raise KeyError(f"نسخه {version} برای {domain} وجود ندارد.")
+        return self.save(domain, self._decode(*row), note=f"rollback to v{version}")
+
+    def record_run(self, domain: str, item_count: int | None, seconds: float, ok: bool = True):
+        """ثبت آمار اجرای اسکرپر: زمان آخرین موفقیت، تعداد خبرها و میانگین زمان استخراج."""
+        now = time.time()
+        with self._lock:
+            if ok:
+                self._conn.execute(
+                    """UPDATE scrapers SET last_success = ?, run_count = run_count + 1, last_item_count = ?,
+                       total_items = total_items + ?,
+                       avg_extract_seconds = COALESCE((avg_extract_seconds * run_count + ?) / (run_count + 1), ?)
+                       WHERE domain = ?""", (now, item_count or 0, item_count or 0, seconds, seconds, domain))
+            else:
+                self._conn.execute("UPDATE scrapers SET last_failure = ?, failure_count = failure_count + 1 WHERE domain = ?",
+                                   (now, domain))
+
+    def stats(self, domain: str) -> dict | None:
+        columns = ("domain", "version", "kind", "created_at", "generation_seconds", "last_success", "last_failure",
+                   "run_count", "failure_count", "last_item_count", "total_items", "avg_extract_seconds")
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(columns)} FROM scrapers WHERE domain = ?", (domain,)).fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def import_json(self, path: str) -> int:
+        """وارد کردن scrapers.json قدیمی؛ فقط دامنه‌هایی که هنوز در پایگاه داده نیستند اضافه می‌شوند."""
+        if not os.path.exists(path): return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: legacy = json.load(f)
+        except (json.JSONDecodeError, OSError): return 0
+        existing = self._snapshot()
+        imported = 0
+        for domain, scraper in legacy.items():
+            if domain not in existing and scraper:
+                self.save(domain, scraper, note=f"imported from {os.path.basename(path)}")
+                imported += 1
+        return imported
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ScraperRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ScraperRegistry()
+    return _registry
+
+
+def load_scrapers() -> dict:
+    return get_registry().all()
+
+
+def get_scraper(domain: str) -> str | dict | None:
+    return get_registry().get(domain)
+
+
+def save_scraper(domain: str, code: str | dict, generation_seconds: float | None = None) -> int:
+    """ذخیره اسکرپر دامنه: رشته کد پایتون یا دیکشنری مشخصات سلکتور (موتور selector_engine)."""
+    return get_registry().save(domain, code, generation_seconds=generation_seconds)
+
+
+def record_scraper_run(domain: str, item_count: int | None, seconds: float, ok: bool = True):
+    try:
+        get_registry().record_run(domain, item_count, seconds, ok)
+    except sqlite3.Error:
+        pass  # ثبت آمار نباید اجرای اصلی را مختل کند
+
+
+def code_hash(scraper_code: str) -> str:
+    return hashlib.sha256(scraper_code.encode('utf-8')).hexdigest()
+
+
+def scraper_hash(scraper: str | dict) -> str:
+    """هش اسکرپر ذخیره شده (کد یا مشخصات سلکتور) برای تشخیص تغییر آن."""
+    if isinstance(scraper, dict):
+        return code_hash(json.dumps(scraper, sort_keys=True, ensure_ascii=False))
+    return code_hash(scraper)
+
+
+def compile_scraper(scraper_code: str):
+    """کد اسکرپر را exec کرده و تابع `scrape_news` را برمی‌گرداند (کش بر اساس هش کد در پردازه‌های scraper_runtime)."""
+    execution_scope = {}
+    exec(scraper_code, execution_scope)
+    scraper_function = execution_scope.get('scrape_news')
+    if not callable(scraper_function):
+        raise ValueError("تابع `scrape_news` در کد تولید شده یافت نشد.")
+    return scraper_function
+
+
+def article_selector_for(scraper_code: str | dict) -> str | None:
+    """سلکتور ظرف خبرها را از اسکرپر بیرون می‌کشد (برای تشخیص آماده بودن صفحه در Selenium)."""
+    if isinstance(scraper_code, dict):
+        return scraper_code.get('best_article_selector')
+    for pattern in _ARTICLE_SELECTOR_PATTERNS:
+        match = pattern.search(scraper_code)
+        if match: return match.group(2)
+    return None
@@ -0,0 +1,111 @@
+# selector_engine.py
+# موتور استخراج مبتنی بر «مشخصات سلکتور» (خروجی مرحله ۲ تحلیل Gemini) به جای کد پایتون تولید شده.
+# سلکتورهای CSS یک بار به XPath کامپایل و کش می‌شوند و هر صفحه فقط یک بار با lxml پارس می‌شود.
+
+import hashlib
+import json
+import threading
+from urllib.parse import urljoin
+
+from lxml import etree, html as lxml_html
+from cssselect import GenericTranslator, SelectorError
+
+SPEC_KEYS = ("best_article_selector", "title_selector", "link_selector", "description_selector")
+SELF = "self"
+
+_translator = GenericTranslator()
+_compiled_specs = {}
+_compiled_lock = threading.Lock()
+_FIRST_LINK = etree.XPath("descendant-or-self::a[@href][1]")
+
+
+class SpecError(ValueError):
+    """مشخصات سلکتور ناقص یا نامعتبر است."""
+
+
+def is_spec(entry) -> bool:
+    return isinstance(entry, dict) and bool(entry.get("best_article_selector"))
+
+
+def _compile(css: str | None, relative: bool):
+    if not css or css.strip().lower() == SELF:
+        return None
+    try:
+        xpath = _translator.css_to_xpath(css, prefix="descendant::" if relative else "descendant-or-self::")
+        return etree.XPath(xpath)
+    except (SelectorError, etree.XPathSyntaxError) as e:
+        raise SpecError(f"سلکتور نامعتبر `{css}`: {e}")
+
+
+class CompiledSpec:
+    def __init__(self, spec: dict):
+        if not is_spec(spec):
+            raise SpecError("کلید `best_article_selector` در مشخصات سلکتور وجود ندارد.")
+        self.base_url = spec.get("base_url") or ""
+        self.article = _compile(spec["best_article_selector"], relative=False)
+        self.title = _compile(spec.get("title_selector"), relative=True)
+        self.link = _compile(spec.get("link_selector"), relative=True)
+        self.description = _compile(spec.get("description_selector"), relative=True)
+
+    @staticmethod
+    def _first(xpath, element):
+        if xpath is None: return element
+        matches = xpath(element)
+        return matches[0] if matches else None
+
+    @staticmethod
+    def _text(element) -> str:
+        return " ".join(element.text_content().split()) if element is not None else ""
+
+    def _href(self, element) -> str | None:
+        if element is None: return None
+        href = element.get("href")
+        if not href:
+            links = _FIRST_LINK(element)
+            href = links[0].get("href") if links else None
+        return urljoin(self.base_url, href.strip()) if href else None
+
+    def extract(self, html_content: str) -> list:
+        if not html_content or not html_content.strip(): return []
+        try:
+            root = lxml_html.document_fromstring(html_content)
+        except (etree.ParserError, ValueError):
+            return []
+        articles = []
+        for container in self.article(root):
+            try:
+                title = self._text(self._first(self.title, container))
+                link = self._href(self._first(self.link, container))
+                description = self._text(self._first(self.description, container)) if self.description is not None else ""
+                if title and link:
+                    articles.append({"title": title, "link": link, "description": description})
+            except Exception:
+                continue
+        return articles
+
+
+def spec_hash(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def compile_spec(spec: dict) -> CompiledSpec:
+    """کامپایل مشخصات با کش بر اساس هش محتوا؛ مشخصات یکسان دوباره کامپایل نمی‌شوند."""
+    digest = spec_hash(spec)
+    compiled = _compiled_specs.get(digest)
+    if compiled is None:
+        compiled = CompiledSpec(spec)
+        with _compiled_lock:
+            _compiled_specs[digest] = compiled
+    return compiled
+
+
+def extract_with_spec(html_content: str, spec: dict) -> list:
+    return compile_spec(spec).extract(html_content)
+
+
+def make_spec(analysis: dict, base_url: str) -> dict:
+    """ساخت مشخصات قابل ذخیره از خروجی مرحله ۲ تحلیل Gemini."""
+    spec = {key: analysis.get(key) for key in SPEC_KEYS}
+    spec["base_url"] = base_url
+    CompiledSpec(spec)  # اعتبارسنجی سلکتورها پیش از ذخیره
+    return spec
@@ -0,0 +1,237 @@
+# telemetry.py
+# اندازه‌گیری زمان و هزینه هر مرحله (دریافت، Selenium، پرامپت‌های ساخت اسکرپر، اجرای اسکرپر، embedding و چت).
+# هر مرحله یک span با مدت زمان و ویژگی‌ها (تعداد توکن ورودی/خروجی، تعداد فراخوانی API، تعداد دسته‌های embedding) است.
+# spanها به اجرای جاری (برای پنل کناری)، به فایل JSON Lines و به شمارنده‌های سراسری با خروجی Prometheus اضافه می‌شوند.
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TELEMETRY_FILE = os.environ.get('SCRAPER_TELEMETRY_FILE', os.path.join('.cache', 'telemetry', 'spans.jsonl'))
+METRICS_HOST = os.environ.get('SCRAPER_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('SCRAPER_METRICS_PORT', '9464'))
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# ویژگی‌های عددی span که در شمارنده‌های سراسری جمع زده می‌شوند
+_COUNTED = ('api_calls', 'prompt_tokens', 'output_tokens', 'embedding_batches', 'items')
+
+
+@dataclass
+class Span:
+    name: str
+    run_id: str | None
+    started_at: float
+    seconds: float = 0.0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            if value: self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Run:
+    """مجموعه spanهای یک اجرا (یک بار پردازش سایت، اجرای دسته‌ای یا یک سؤال چت)."""
+
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = time.time()
+        self.finished_at = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock: self.spans.append(span)
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def by_stage(self) -> list:
+        """جمع زمان و ویژگی‌های عددی هر مرحله به ترتیب اولین اجرا."""
+        stages = OrderedDict()
+        with self._lock: spans = list(self.spans)
+        for span in spans:
+            row = stages.setdefault(span.name, {'stage': span.name, 'count': 0, 'seconds': 0.0, 'errors': 0})
+            row['count'] += 1
+            row['seconds'] += span.seconds
+            row['errors'] += span.error is not None
+            for key in _COUNTED:
+                if span.attributes.get(key): row[key] = row.get(key, 0) + span.attributes[key]
+        return list(stages.values())
+
+    def totals(self) -> dict:
+        totals = {key: 0 for key in _COUNTED}
+        for row in self.by_stage():
+            for key in _COUNTED: totals[key] += row.get(key, 0)
+        return totals
+
+    def to_jsonl(self) -> str:
+        with self._lock: spans = list(self.spans)
+        return "".join(json.dumps({'run_label': self.label, **span.to_dict()}, ensure_ascii=False) + "\n" for span in spans)
+
+
+_current_run = contextvars.ContextVar('telemetry_run', default=None)
+
+
+def current_run() -> Run | None:
+    return _current_run.get()
+
+
+@contextlib.contextmanager
+def run(label: str):
+    """اجرای جدید؛ spanهای ساخته شده در این بلوک (و در کارهای ارسال شده با `submit`) به آن اضافه می‌شوند."""
+    new_run = Run(label)
+    token = _current_run.set(new_run)
+    try:
+        yield new_run
+    finally:
+        new_run.finished_at = time.time()
+        _current_run.reset(token)
+
+
+def submit(executor, func, *args, **kwargs):
+    """مانند executor.submit، با انتقال اجرای جاری به نخ کارگر (contextvars به صورت خودکار منتقل نمی‌شوند)."""
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+# --- شمارنده‌های سراسری (خروجی Prometheus) ---
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # stage -> [تعداد در هر bucket، جمع، تعداد]
+        self._counters = {}    # (نام، stage) -> مقدار
+
+    def observe(self, span: Span):
+        with self._lock:
+            histogram = self._histograms.setdefault(span.name, [[0] * len(_BUCKETS), 0.0, 0])
+            for i, bound in enumerate(_BUCKETS):
+                if span.seconds <= bound: histogram[0][i] += 1
+            histogram[1] += span.seconds
+            histogram[2] += 1
+            if span.error: self._inc('errors', span.name, 1)
+            for key in _COUNTED:
+                if span.attributes.get(key): self._inc(key, span.name, span.attributes[key])
+
+    def _inc(self, name: str, stage: str, value: float):
+        self._counters[(name, stage)] = self._counters.get((name, stage), 0) + value
+
+    def render(self) -> str:
+        """متن قالب exposition پرومتئوس."""
+        with self._lock:
+            histograms = {stage: (list(b), s, c) for stage, (b, s, c) in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = ["# HELP scraper_stage_duration_seconds Duration of each pipeline stage.",
+                 "# TYPE scraper_stage_duration_seconds histogram"]
+        for stage, (buckets, total, count) in sorted(histograms.items()):
+            label = f'stage="{_escape(stage)}"'
+            for bound, value in zip(_BUCKETS, buckets):
+                lines.append(f'scraper_stage_duration_seconds_bucket{{{label},le="{bound}"}} {value}')
+            lines += [f'scraper_stage_duration_seconds_bucket{{{label},le="+Inf"}} {count}',
+                      f'scraper_stage_duration_seconds_sum{{{label}}} {total}',
+                      f'scraper_stage_duration_seconds_count{{{label}}} {count}']
+        for name in ('errors',) + _COUNTED:
+            rows = sorted((stage, value) for (counter, stage), value in counters.items() if counter == name)
+            if not rows: continue
+            lines += [f"# HELP scraper_{name}_total Total {name.replace('_', ' ')} per stage.", f"# TYPE scraper_{name}_total counter"]
+            lines += [f'scraper_{name}_total{{stage="{_escape(stage)}"}} {value}' for stage, value in rows]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _JsonLinesExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, span: Span):
+        if not self.path: return
+        line = json.dumps(span.to_dict(), ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    if os.path.dirname(self.path): os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line)
+                self._file.flush()
+            except OSError:
+                self.path = None  # خطای دیسک نباید پردازش اصلی را متوقف کند
+
+
+exporter = _JsonLinesExporter(TELEMETRY_FILE)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """اندازه‌گیری یک مرحله؛ ویژگی‌ها را می‌توان در طول بلوک با `span.set` یا `span.add` کامل کرد."""
+    active_run = _current_run.get()
+    current = Span(name=name, run_id=active_run.id if active_run else None, started_at=time.time())
+    current.set(**attributes)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        if active_run is not None: active_run.add(current)
+        metrics.observe(current)
+        exporter.write(current)
+
+
+def record_usage(current: Span, response):
+    """ثبت یک فراخوانی مدل و تعداد توکن‌های آن از `usage_metadata` پاسخ Gemini (در صورت وجود)."""
+    current.add(api_calls=1)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None: return
+    current.add(prompt_tokens=getattr(usage, 'prompt_token_count', 0) or 0,
+                output_tokens=getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+# --- سرور /metrics ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer | None:
+    """سرور HTTP پس‌زمینه برای `/metrics`؛ اگر پورت اشغال باشد (مثلاً پردازه دیگری آن را باز کرده) None برمی‌گرداند."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
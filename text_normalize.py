@@ -0,0 +1,49 @@
+# text_normalize.py
+# یکسان‌سازی متن فارسی (و لاتین) برای مقایسه: ی و ک عربی، نیم‌فاصله، اعراب و علائم ترکیبی، کشیده و ارقام.
+# هم در تشخیص نوع سؤال و کلید کش پاسخ (chat_engine) و هم در شاخص واژگانی (lexical_index) استفاده می‌شود
+# تا سؤال و متن خبرها به یک شکل نرمال شوند.
+
+import re
+import unicodedata
+from functools import lru_cache
+
+_CHARACTER_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'ؤ': 'و',
+    '\u200c': ' ', '\u200d': '', '\u200e': '', '\u200f': '', '\u0640': '',  # نیم‌فاصله، اتصال، جهت متن، کشیده
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> str:
+    """متن نرمال شده با حروف کوچک و فاصله‌های یکسان؛ علائم نگارشی به فاصله تبدیل می‌شوند."""
+    # NFKD اعراب، همزه و مد (آ، أ، إ) و accentهای لاتین را به علامت ترکیبی جدا تبدیل می‌کند که حذف می‌شوند
+    text = unicodedata.normalize('NFKD', text.translate(_CHARACTER_MAP))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r'[^\w\s]|_', ' ', text.lower())
+    return " ".join(text.split())
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(normalize_text(text))
+
+
+@lru_cache(maxsize=1024)
+def _phrase_pattern(phrase: str) -> re.Pattern:
+    phrase = normalize_text(phrase)
+    # پسوندهای فارسی (ها، های، ی) به کلمه می‌چسبند؛ عبارت‌های فارسی بلندتر از ۳ حرف ابتدای کلمه را هم می‌پذیرند
+    suffix = r'\w*' if len(phrase) > 3 and not phrase.isascii() else ''
+    return re.compile(rf'(?<!\w){re.escape(phrase)}{suffix}(?!\w)')
+
+
+def phrase_hits(text: str, phrases) -> int:
+    """تعداد عبارت‌هایی که به صورت کلمه کامل در متن نرمال شده وجود دارند ('count' در 'country' شمرده نمی‌شود)."""
+    return sum(1 for phrase in phrases if _phrase_pattern(phrase).search(text))
+
+
+def remove_phrases(text: str, phrases) -> str:
+    """حذف عبارت‌ها (فقط به صورت کلمه کامل) از متن نرمال شده؛ عبارت‌های بلندتر اول."""
+    for phrase in sorted(phrases, key=len, reverse=True):
+        text = _phrase_pattern(phrase).sub(' ', text)
+    return " ".join(text.split())
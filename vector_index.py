@@ -0,0 +1,339 @@
+# vector_index.py
+# شاخص برداری: ماتریس float32 پیوسته با سطرهای از پیش نرمال شده و آرایه‌های موازی متادیتا.
+# جستجو = یک ضرب ماتریس در بردار + argpartition. ذخیره روی دیسک به صورت فایل memory-map برای هر دامنه.
+# فایل‌های هر سطر (بردار، متن، نمایه واژگانی) فقط به انتها اضافه می‌شوند و meta.json اندازه معتبر هر فایل را نگه می‌دارد؛
+# بنابراین ذخیره پس از افزودن چند خبر به اندازه همان خبرهاست، نه کل شاخص. بازنویسی کامل فقط هنگام فشرده‌سازی
+# (حذف سطرهای جایگزین شده) یا ساخت دوباره حالت تقریبی انجام می‌شود.
+# برای شاخص‌های بزرگ، حالت تقریبی (IVF: خوشه‌بندی k-means کروی و جستجو فقط در نزدیک‌ترین خوشه‌ها) در دسترس است.
+# در کنار بردارها یک شاخص واژگانی BM25 (lexical_index) روی همان متن‌ها نگهداری می‌شود (جستجوی ترکیبی).
+# هر خبر با لینک نرمال شده‌اش یک سطر دارد؛ افزودن دوباره همان لینک، سطر قبلی را جایگزین می‌کند.
+# نوشتن شاخص دامنه (رابط کاربری و کارگرها) با index_lock بین پردازه‌ها ترتیبی می‌شود.
+
+import io
+import json
+import os
+import re
+from contextlib import contextmanager
+
+import numpy as np
+
+from incremental import normalize_link
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+try:
+    import fcntl
+except ImportError:  # ویندوز
+    fcntl = None
+
+INDEX_DIR = os.path.join('.cache', 'indexes')
+ANN_THRESHOLD = 200_000  # از این تعداد سند به بعد، حالت تقریبی به صورت خودکار ساخته می‌شود
+ANN_PROBES = 8
+_KMEANS_ITERATIONS = 8
+_CHUNK = 65_536
+HYBRID_CANDIDATES = 4  # هر روش چند برابر top_k نامزد برای ترکیب RRF برمی‌گرداند
+COMPACT_DELETED_RATIO = 0.2  # اگر سهم سطرهای جایگزین شده از این بیشتر شود، ذخیره بعدی شاخص را فشرده و بازنویسی می‌کند
+INDEX_FORMAT = 2
+_ROW_FILES = ("vectors.f32", "documents.jsonl", "lexical_terms.jsonl", "lexical_term_ids.i32", "lexical_counts.i32",
+              "lexical_sizes.i32", "assignments.i32")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1: vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+def index_path(domain: str) -> str:
+    return os.path.join(INDEX_DIR, re.sub(r'[^A-Za-z0-9_.-]', '_', domain))
+
+
+@contextmanager
+def index_lock(domain: str):
+    """قفل انحصاری نوشتن شاخص دامنه؛ داخل قفل شاخص از دیسک بارگذاری، به‌روز و ذخیره می‌شود تا سطرهای نویسنده دیگر از دست نروند."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(index_path(domain) + ".lock", "a") as f:
+        if fcntl is not None: fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None: fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def document_text(item: dict) -> str:
+    """متن هر خبر در شاخص؛ لینک خبر داخل متن است تا در پاسخ‌های چت به عنوان منبع در دسترس باشد."""
+    return f"عنوان: {item.get('title', '')}\nتوضیحات: {item.get('description', '')}\nمنبع (لینک): {item.get('link', '')}"
+
+
+def index_version(domain: str) -> float | None:
+    """زمان آخرین ذخیره شاخص دامنه روی دیسک (برای باطل کردن کش‌های مشترک بین جلسات)."""
+    try:
+        return os.path.getmtime(os.path.join(index_path(domain), "meta.json"))
+    except OSError:
+        return None
+
+
+class VectorIndex:
+    def __init__(self, dim: int | None = None):
+        self.dim = dim
+        self._matrix = np.empty((0, dim or 0), dtype=np.float32)
+        self._size = 0
+        self.contents = []
+        self.metadata = []
+        self.lexical = LexicalIndex()
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._keys = []        # لینک نرمال شده هر سطر (None برای سند بدون لینک)
+        self._rows = None      # لینک -> سطر فعلی؛ در اولین نیاز ساخته می‌شود
+        self._deleted = set()  # سطرهای جایگزین شده؛ در جستجو نمی‌آیند و هنگام فشرده‌سازی حذف می‌شوند
+        self._ann_version = 0
+        self._saved = None     # وضعیت آخرین ذخیره/بارگذاری از دیسک (مسیر و اندازه فایل‌ها) برای ذخیره افزایشی
+
+    def __len__(self) -> int:
+        return self._size - len(self._deleted)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._matrix[:self._size]
+
+    @property
+    def has_ann(self) -> bool:
+        return self.centroids is not None
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0] and self._matrix.flags.writeable: return
+        capacity = max(needed, int(self._matrix.shape[0] * 1.5), 64)
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]  # نسخه‌ای در حافظه از فایل mmap فقط-خواندنی
+        self._matrix = grown
+
+    def _row_map(self) -> dict:
+        if self._rows is None:
+            self._rows = {key: row for row, key in enumerate(self._keys) if key is not None and row not in self._deleted}
+        return self._rows
+
+    def pending(self, items: list) -> list:
+        """خبرهایی که هنوز در شاخص نیستند یا متنشان تغییر کرده است (فقط همین‌ها باید embedding و اضافه شوند)."""
+        rows = self._row_map()
+        result = []
+        for item in items:
+            row = rows.get(normalize_link(item['link'])) if item.get('link') else None
+            if row is None or self.contents[row] != document_text(item): result.append(item)
+        return result
+
+    def add(self, vectors, contents: list, metadata: list | None = None):
+        vectors = _normalize(vectors)
+        if len(vectors) != len(contents):
+            raise ValueError("تعداد بردارها و متن‌ها برابر نیست.")
+        if not len(vectors): return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._matrix = np.empty((0, self.dim), dtype=np.float32)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"ابعاد بردار ({vectors.shape[1]}) با شاخص ({self.dim}) یکسان نیست.")
+        metadata = metadata if metadata is not None else [{} for _ in contents]
+        start = self._size
+        self._reserve(len(vectors))
+        self._matrix[self._size:self._size + len(vectors)] = vectors
+        self._size += len(vectors)
+        self.contents.extend(contents)
+        self.metadata.extend(metadata)
+        self.lexical.add(contents)
+        # سطر قبلی همان لینک (خبر تغییر یافته یا افزوده شده دوباره) کنار گذاشته می‌شود
+        rows, replaced = self._row_map(), []
+        for row, meta in enumerate(metadata, start=start):
+            key = normalize_link(meta['link']) if meta.get('link') else None
+            self._keys.append(key)
+            if key is None: continue
+            if key in rows: replaced.append(rows[key])
+            rows[key] = row
+        if replaced:
+            self._deleted.update(replaced)
+            self.lexical.remove(replaced)
+        if self.has_ann:
+            self._assignments = np.concatenate([self._assignments, self._assign(vectors)])
+        elif self._size >= ANN_THRESHOLD:
+            self.build_ann()
+
+    # --- جستجو ---
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+        if top_k >= len(scores): return np.argsort(-scores)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def search(self, query_vector, top_k: int = 7, exact: bool = False) -> list:
+        """خروجی: فهرست (شماره سند، امتیاز شباهت کسینوسی) به ترتیب نزولی."""
+        if not len(self): return []
+        query = _normalize(query_vector)[0]
+        if self.has_ann and not exact:
+            candidate_ids = self._ann_candidates(query)
+            if self._deleted: candidate_ids = np.setdiff1d(candidate_ids, list(self._deleted), assume_unique=True)
+            scores = self.vectors[candidate_ids] @ query
+            order = self._top_k(scores, top_k)
+            return [(int(candidate_ids[i]), float(scores[i])) for i in order]
+        scores = self.vectors @ query
+        if self._deleted: scores[list(self._deleted)] = -np.inf
+        return [(int(i), float(scores[i])) for i in self._top_k(scores, min(top_k, len(self)))]
+
+    def hybrid_search(self, query: str, query_vector=None, top_k: int = 7, exact: bool = False) -> list:
+        """ترکیب RRF جستجوی برداری و BM25؛ بدون query_vector فقط جستجوی واژگانی انجام می‌شود.
+        خروجی: فهرست (شماره سند، امتیاز ترکیبی یا BM25) به ترتیب نزولی."""
+        lexical = self.lexical.search(query, top_k=top_k * HYBRID_CANDIDATES)
+        if query_vector is None: return lexical[:top_k]
+        dense = self.search(query_vector, top_k=top_k * HYBRID_CANDIDATES, exact=exact)
+        return reciprocal_rank_fusion([dense, lexical], top_k=top_k)
+
+    # --- حالت تقریبی (IVF) ---
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _CHUNK):
+            assignments[start:start + _CHUNK] = np.argmax(vectors[start:start + _CHUNK] @ self.centroids.T, axis=1)
+        return assignments
+
+    def build_ann(self, n_lists: int | None = None, seed: int = 0):
+        """خوشه‌بندی k-means کروی روی بردارها؛ جستجو پس از آن فقط در نزدیک‌ترین خوشه‌ها انجام می‌شود."""
+        if not self._size: return
+        n_lists = n_lists or max(1, int(np.sqrt(self._size)))
+        rng = np.random.default_rng(seed)
+        sample_size = min(self._size, n_lists * 64)
+        sample = self.vectors[np.sort(rng.choice(self._size, sample_size, replace=False))]
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~np.any(sums, axis=1)
+            sums[empty] = self.centroids[empty]
+            self.centroids = _normalize(sums)
+        self._assignments = self._assign(self.vectors)
+        self._ann_version += 1
+
+    def _ann_candidates(self, query: np.ndarray, probes: int = ANN_PROBES) -> np.ndarray:
+        centroid_scores = self.centroids @ query
+        probe_lists = self._top_k(centroid_scores, min(probes, len(self.centroids)))
+        return np.flatnonzero(np.isin(self._assignments, probe_lists))
+
+    def compact(self):
+        """حذف واقعی سطرهای جایگزین شده؛ شماره سطرها تغییر می‌کند و ذخیره بعدی کامل خواهد بود."""
+        if not self._deleted: return
+        live = np.ones(self._size, dtype=bool)
+        live[list(self._deleted)] = False
+        self._matrix = np.ascontiguousarray(self.vectors[live])
+        self._size = int(live.sum())
+        self.contents = [content for content, keep in zip(self.contents, live) if keep]
+        self.metadata = [meta for meta, keep in zip(self.metadata, live) if keep]
+        self._keys = [key for key, keep in zip(self._keys, live) if keep]
+        if self.has_ann: self._assignments = self._assignments[live]
+        self.lexical.compact(live)
+        self._deleted, self._rows, self._saved = set(), None, None
+
+    # --- ذخیره و بارگذاری ---
+    def save(self, path: str):
+        """فقط سطرهای اضافه شده پس از آخرین ذخیره/بارگذاری همین مسیر به انتهای فایل‌ها اضافه می‌شوند؛
+        meta.json (با تعداد سطرها و اندازه معتبر فایل‌ها) در پایان و به صورت اتمی نوشته می‌شود."""
+        if len(self._deleted) > COMPACT_DELETED_RATIO * self._size: self.compact()
+        saved = self._saved
+        if (saved is None or saved["path"] != os.path.abspath(path) or saved["ann"] != self._ann_version
+                or not os.path.exists(os.path.join(path, "meta.json"))):
+            saved = None
+        os.makedirs(path, exist_ok=True)
+        start = saved["count"] if saved else 0
+        sizes = dict(saved["sizes"]) if saved else dict.fromkeys(_ROW_FILES, 0)
+        terms, term_ids, counts, doc_sizes = self.lexical.doc_arrays(start)
+        new_terms = terms[saved["terms"] if saved else 0:]
+        rows = zip(self.contents[start:], self.metadata[start:], self._keys[start:])
+        data = {
+            "vectors.f32": self.vectors[start:].tobytes(),
+            "documents.jsonl": "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8'),
+            "lexical_terms.jsonl": "".join(json.dumps(term, ensure_ascii=False) + "\n" for term in new_terms).encode('utf-8'),
+            "lexical_term_ids.i32": term_ids.tobytes(), "lexical_counts.i32": counts.tobytes(),
+            "lexical_sizes.i32": doc_sizes.tobytes(),
+            "assignments.i32": self._assignments[start:].astype(np.int32).tobytes() if self.has_ann else b"",
+        }
+        for name, content in data.items():
+            _write_file(os.path.join(path, name), content, sizes[name] if saved else None)
+            sizes[name] += len(content)
+        if saved is None:
+            if self.has_ann:
+                _write_file(os.path.join(path, "centroids.npy"), _npy_bytes(self.centroids), None)
+            elif os.path.exists(os.path.join(path, "centroids.npy")):
+                os.remove(os.path.join(path, "centroids.npy"))
+        meta = {"format": INDEX_FORMAT, "dim": self.dim, "count": self._size, "terms": len(terms),
+                "deleted": sorted(self._deleted), "ann": self.has_ann, "sizes": sizes}
+        tmp_path = os.path.join(path, "meta.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, "meta.json"))
+        self._saved = {"path": os.path.abspath(path), "count": self._size, "terms": len(terms),
+                       "ann": self._ann_version, "sizes": sizes}
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorIndex | None":
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path): return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
+            # شاخص‌های قالب قدیمی بارگذاری نمی‌شوند و در اولین ساخت دوباره از روی خبرها ایجاد می‌شوند
+            if meta.get("format") != INDEX_FORMAT: return None
+            index, count, sizes = cls(meta["dim"]), meta["count"], meta["sizes"]
+            if count:
+                shape = (count, meta["dim"])
+                vectors_path = os.path.join(path, "vectors.f32")
+                index._matrix = (np.memmap(vectors_path, dtype=np.float32, mode='r', shape=shape) if mmap
+                                 else np.fromfile(vectors_path, dtype=np.float32, count=count * meta["dim"]).reshape(shape))
+            index._size = count
+            documents = _read_lines(os.path.join(path, "documents.jsonl"), sizes["documents.jsonl"])
+            if len(documents) != count: return None
+            index.contents = [row[0] for row in documents]
+            index.metadata = [row[1] for row in documents]
+            index._keys = [row[2] for row in documents]
+            terms = _read_lines(os.path.join(path, "lexical_terms.jsonl"), sizes["lexical_terms.jsonl"])
+            index.lexical = LexicalIndex.from_doc_arrays(
+                terms, *(_read_ints(os.path.join(path, name), sizes[name])
+                         for name in ("lexical_term_ids.i32", "lexical_counts.i32", "lexical_sizes.i32")))
+            if meta["deleted"]:
+                index._deleted = set(meta["deleted"])
+                index.lexical.remove(meta["deleted"])
+            if meta["ann"]:
+                index.centroids = np.load(os.path.join(path, "centroids.npy"))
+                index._assignments = _read_ints(os.path.join(path, "assignments.i32"), sizes["assignments.i32"])
+            index._saved = {"path": os.path.abspath(path), "count": count, "terms": len(terms),
+                            "ann": index._ann_version, "sizes": sizes}
+            return index
+        except (OSError, ValueError, KeyError, IndexError, json.JSONDecodeError):
+            return None
+
+
+def _write_file(path: str, content: bytes, offset: int | None):
+    """offset=None: بازنویسی کامل (فایل موقت و جایگزینی اتمی). در غیر این صورت داده پس از offset نوشته می‌شود؛
+    بخش ناقص یک ذخیره قطع شده (پس از اندازه ثبت شده در meta.json) ابتدا بریده می‌شود."""
+    if offset is None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f: f.write(content)
+        os.replace(tmp_path, path)
+        return
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(content)
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def _read_ints(path: str, size: int) -> np.ndarray:
+    if not size: return np.empty(0, dtype=np.int32)
+    return np.fromfile(path, dtype=np.int32, count=size // 4)
+
+
+def _read_lines(path: str, size: int) -> list:
+    """خواندن فقط size بایت اول فایل JSON Lines (سطرهای ذخیره قطع شده نادیده گرفته می‌شوند)."""
+    if not size: return []
+    with open(path, 'rb') as f: text = f.read(size).decode('utf-8')
+    # رشته‌های JSON شامل newline خام نیستند؛ بنابراین split('\n') (برخلاف splitlines) امن است
+    return json.loads("[" + ",".join(text.rstrip("\n").split("\n")) + "]")
@@ -0,0 +1,229 @@
+# worker.py
+# کارگرهای پس‌زمینه: کارها را از صف مشترک (jobs.py) برداشته، صفحه را دریافت و اسکرپر ذخیره شده را اجرا می‌کنند،
+# خبرها را در مخزن مشترک (incremental.py) ثبت کرده و خبرهای جدید یا تغییر یافته را به شاخص برداری دامنه روی دیسک اضافه می‌کنند.
+# رابط کاربری فقط کار ثبت می‌کند و نتایج را از همین مخزن می‌خواند؛ بنابراین پردازش‌های طولانی آن را قفل نمی‌کنند.
+#
+#   python worker.py run --processes 4                    # اجرای کارگرها (و برنامه‌های زمان‌بندی شده)
+#   python worker.py enqueue https://www.dw.com/es/ --selenium
+#   python worker.py schedule https://www.france24.com/es/ --every 30m
+#   python worker.py status
+
+import argparse
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import sys
+import time
+
+import google.generativeai as genai
+import numpy as np
+
+import telemetry
+from browser_pool import BrowserPool, SELENIUM_AVAILABLE
+from crawler import create_session, crawl_many
+from embeddings import embed_texts
+from incremental import dedupe_articles, get_store
+from jobs import FETCH_SELENIUM, FETCH_SIMPLE, get_queue
+from scraper_runtime import get_pool, run_saved_scraper
+from scraper_store import article_selector_for, get_scraper, record_scraper_run
+from vector_index import VectorIndex, document_text, index_lock, index_path
+
+DEFAULT_POLL_SECONDS = 2.0
+SECRETS_FILE = os.path.join('.streamlit', 'secrets.toml')
+
+
+class PermanentJobError(Exception):
+    """خطایی که با تلاش مجدد برطرف نمی‌شود (مثلاً نبود اسکرپر ذخیره شده برای دامنه)."""
+
+
+def configure_gemini() -> bool:
+    """کلید API از متغیر محیطی GEMINI_API_KEY یا از همان secrets.toml برنامه Streamlit خوانده می‌شود."""
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if not api_key and os.path.exists(SECRETS_FILE):
+        try:
+            import tomllib
+            with open(SECRETS_FILE, 'rb') as f: api_key = tomllib.load(f).get('GEMINI_API_KEY')
+        except (ImportError, ValueError, OSError):
+            api_key = None
+    if not api_key: return False
+    genai.configure(api_key=api_key)
+    return True
+
+
+def update_shared_index(domain: str, articles: list) -> int:
+    """اضافه کردن خبرهایی از articles که در شاخص دامنه روی دیسک نیستند یا تغییر کرده‌اند (VectorIndex.pending).
+    تفاوت با خود شاخص حساب می‌شود، پس خبرهایی که قبلاً (مثلاً بدون کلید API) ایندکس نشده‌اند هم اضافه می‌شوند."""
+    articles = [item for item in articles if item.get('title') and item.get('link')]
+    # embedding بیرون از قفل؛ داخل قفل همان متن‌ها از کش روی دیسک خوانده می‌شوند
+    current = VectorIndex.load(index_path(domain))
+    pending = current.pending(articles) if current is not None else articles
+    if not pending: return 0
+    embed_texts([document_text(item) for item in pending], task_type="RETRIEVAL_DOCUMENT")
+    with index_lock(domain):
+        index = VectorIndex.load(index_path(domain), mmap=False) or VectorIndex()
+        items = index.pending(articles)
+        if not items: return 0
+        contents = [document_text(item) for item in items]
+        vectors, _ = embed_texts(contents, task_type="RETRIEVAL_DOCUMENT")
+        with telemetry.span('index', documents=len(contents)):
+            index.add(np.vstack(vectors), contents, [{"link": item.get('link'), "source": item.get('source')} for item in items])
+            index.save(index_path(domain))
+    return len(items)
+
+
+def process_job(job, session=None, browser_pool: BrowserPool | None = None, can_embed: bool = True) -> dict:
+    scraper = get_scraper(job.domain)
+    if scraper is None:
+        raise PermanentJobError(f"no saved scraper for {job.domain}")
+
+    if job.fetch_method == FETCH_SELENIUM:
+        if browser_pool is None:
+            raise PermanentJobError("Selenium is not available in this worker")
+        html = browser_pool.fetch(job.url, wait_selector=article_selector_for(scraper))
+        started = time.perf_counter()
+        articles = run_saved_scraper(html, scraper, job.domain) or []
+        record_scraper_run(job.domain, len(articles), time.perf_counter() - started)
+        for item in articles:
+            if isinstance(item, dict): item.setdefault('source', job.domain)
+        new_items = get_store().record_articles(job.domain, articles, job.url)
+        articles = dedupe_articles(articles)
+        result = {'items': len(articles), 'new_items': len(new_items), 'not_modified': False}
+    else:
+        # همان مسیر crawler.py: درخواست شرطی، اجرای اسکرپر و ثبت خبرهای جدید در مخزن افزایشی
+        crawl = next(crawl_many([job.url], scrapers={job.domain: scraper}, session=session, incremental=True))
+        if not crawl.ok: raise RuntimeError(crawl.error)
+        articles = crawl.articles
+        result = {'items': len(articles), 'new_items': len(crawl.new_articles or []), 'not_modified': crawl.not_modified}
+
+    # شاخص با همه خبرهای صفحه مقایسه می‌شود، نه فقط خبرهای «جدید» مخزن افزایشی؛ خبری که یک بار بدون
+    # embedding ثبت شده، در اولین اجرای بعدی با کلید API ایندکس می‌شود
+    if not can_embed:
+        result['indexed'], result['index_error'] = 0, "GEMINI_API_KEY is not configured"
+    else:
+        result['indexed'] = update_shared_index(job.domain, articles)
+    return result
+
+
+def worker_loop(name: str, poll_seconds: float = DEFAULT_POLL_SECONDS, selenium: bool = False,
+                drain: bool = False, sandbox_processes: int = 1):
+    """حلقه یک کارگر؛ با drain=True پس از خالی شدن صف خارج می‌شود (مناسب اجرای دوره‌ای با cron)."""
+    queue = get_queue()
+    get_pool(processes=sandbox_processes)  # هر کارگر فقط یک کار هم‌زمان دارد؛ استخر ایزوله کوچک کافی است
+    session = create_session(4)
+    browser_pool = BrowserPool(max_size=1) if selenium and SELENIUM_AVAILABLE else None
+    # کارگر بدون مرورگر کارهای Selenium را برنمی‌دارد تا برای کارگرهای --selenium باقی بمانند
+    fetch_methods = (FETCH_SIMPLE, FETCH_SELENIUM) if browser_pool is not None else (FETCH_SIMPLE,)
+    can_embed = configure_gemini()
+    if not can_embed:
+        print(f"[{name}] GEMINI_API_KEY not found; results are stored but not embedded.", file=sys.stderr)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        while not stopping:
+            queue.enqueue_due()
+            job = queue.claim(name, fetch_methods=fetch_methods)
+            if job is None:
+                if drain: break
+                time.sleep(poll_seconds)
+                continue
+            started = time.perf_counter()
+            with telemetry.run(f"job {job.id}: {job.url}"):
+                try:
+                    result = process_job(job, session, browser_pool, can_embed)
+                    queue.complete(job.id, result)
+                    print(f"[{name}] job {job.id} {job.url}: {result} ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+                except PermanentJobError as e:
+                    queue.fail(job.id, str(e), retry=False)
+                    print(f"[{name}] job {job.id} {job.url} failed: {e}", file=sys.stderr)
+                except Exception as e:
+                    queue.fail(job.id, f"{type(e).__name__}: {e}")
+                    print(f"[{name}] job {job.id} {job.url} error: {type(e).__name__}: {e}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if browser_pool is not None: browser_pool.close()
+        session.close()
+
+
+def parse_interval(text: str) -> float:
+    """'90' (ثانیه)، '30m'، '2h' یا '1d'."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', text.lower())
+    if not match: raise argparse.ArgumentTypeError(f"invalid interval: {text}")
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+
+
+def run(args) -> int:
+    base = f"{socket.gethostname()}-{os.getpid()}"
+    options = dict(poll_seconds=args.poll, selenium=args.selenium, drain=args.drain, sandbox_processes=args.sandbox_processes)
+    if args.processes <= 1:
+        worker_loop(base, **options)
+        return 0
+    # پردازه‌های غیر daemon، چون هر کارگر استخر ایزوله اسکرپر خودش را می‌سازد
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=worker_loop, args=(f"{base}-{i}",), kwargs=options, name=f"worker-{i}")
+               for i in range(args.processes)]
+    for process in workers: process.start()
+    try:
+        for process in workers: process.join()
+    except KeyboardInterrupt:
+        for process in workers: process.terminate()
+        for process in workers: process.join()
+    return 0
+
+
+def status(args) -> int:
+    queue = get_queue()
+    print("jobs:", queue.counts())
+    for schedule in queue.schedules():
+        print(f"[schedule] {schedule['url']} every {schedule['interval_seconds']:.0f}s, "
+              f"next {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(schedule['next_run_at']))}")
+    for job in queue.recent(args.limit):
+        print(f"[{job.status}] #{job.id} {job.url} ({job.fetch_method}, attempts {job.attempts})"
+              f"{' ' + str(job.result) if job.result else ''}{' ' + job.error if job.error else ''}")
+    return 0
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="کارگرهای پس‌زمینه دریافت، استخراج و ساخت شاخص برداری.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="اجرای کارگرها")
+    run_parser.add_argument("-p", "--processes", type=int, default=1, help="تعداد پردازه‌های کارگر")
+    run_parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, help="فاصله بررسی صف خالی (ثانیه)")
+    run_parser.add_argument("--selenium", action="store_true", help="پذیرفتن کارهای Selenium (یک مرورگر برای هر کارگر)")
+    run_parser.add_argument("--drain", action="store_true", help="خروج پس از خالی شدن صف")
+    run_parser.add_argument("--sandbox-processes", type=int, default=1, help="اندازه استخر ایزوله اسکرپر هر کارگر")
+
+    enqueue_parser = commands.add_parser("enqueue", help="ثبت کار برای یک یا چند آدرس")
+    enqueue_parser.add_argument("urls", nargs="+")
+    enqueue_parser.add_argument("--selenium", action="store_true")
+
+    schedule_parser = commands.add_parser("schedule", help="زمان‌بندی دریافت دوره‌ای یک آدرس")
+    schedule_parser.add_argument("url")
+    schedule_parser.add_argument("--every", type=parse_interval, help="فاصله اجرا، مثلاً 30m یا 2h")
+    schedule_parser.add_argument("--selenium", action="store_true")
+    schedule_parser.add_argument("--remove", action="store_true", help="حذف زمان‌بندی")
+
+    status_parser = commands.add_parser("status", help="وضعیت صف و زمان‌بندی‌ها")
+    status_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "run": return run(args)
+    if args.command == "status": return status(args)
+    queue = get_queue()
+    fetch_method = FETCH_SELENIUM if args.selenium else FETCH_SIMPLE
+    if args.command == "enqueue":
+        for url in args.urls: print(f"#{queue.enqueue(url, fetch_method)} {url}")
+    elif args.remove:
+        queue.unschedule(args.url)
+    elif args.every:
+        queue.schedule(args.url, args.every, fetch_method)
+    else:
+        parser.error("--every یا --remove لازم است.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())